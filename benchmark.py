@@ -0,0 +1,783 @@
+import os
+import sys
+import tracemalloc
+from collections import Counter
+from itertools import islice, product
+from random import randint, seed
+from timeit import default_timer as timer
+from groups.finitefield import FiniteField
+from groups.ellipticcurve import EllipticCurve, prime_order_curve
+from groups.ecpoint import ECPoint
+from groups.fieldelement import batch_inverse
+from groups.exponentiation import multi_exp, pippenger, sliding_window_pow, straus, wnaf_pow
+from groups.intmodp import IntModP
+from groups.memo import cache_stats
+from groups.order import element_order
+from groups.pairing import (PreparedPoint, ate_loop, ate_pairing, tate_pairing, tate_product,
+                            trace_zero, weil_pairing)
+from groups.pointcounting import naive_trace, random_point
+from groups.polynomial import schoolbook, karatsuba, kronecker, poly_divmod, poly_inverse, trim
+from number_theory import (batch_smooth, chinese_remainder_theorem, dsa_parameters, ecm,
+                           eratosthenes, extended_euclid, is_b_smooth, is_prime, pollard_brent,
+                           prime_factorise, primitive_root, product_tree, random_prime,
+                           reduced_row_echelon, safe_prime, sparse_solve)
+from discrete_log import (BabySteps, PohligHellman, _ints_mod_p_shuffle, babystep_giantstep,
+                          discrete_log_pp, ec_rho, index_calculus, kangaroo, pohlig_hellman,
+                          pollard_rho, relation_batches, rho, supersingular)
+
+
+def timed(f, *args, repeat=1):
+    start = timer()
+    for _ in range(repeat):
+        out = f(*args)
+    return (timer() - start) / repeat, out
+
+
+def report(name, results, unit='s'):
+    print(name)
+    for label, value in results:
+        print('    {:<44}{:>14.4g}{}'.format(label, value, unit))
+
+
+def prime_curve_point(p=2**61-1, a=2, b=3, f=None):
+    # p = 3 (mod 4) so square roots are a single exponentiation
+    f = f or FiniteField(p, 1)
+    c = EllipticCurve((a, b), f)
+    while True:
+        x = randint(0, p-1)
+        y_squared = (x**3 + a*x + b) % p
+        y = pow(y_squared, (p+1)//4, p)
+        if y*y % p == y_squared:
+            return c.point(x, y)
+
+
+def extension_curve_point():
+    f = FiniteField(547, 2, [1, 0, 1])
+    c = EllipticCurve((1, 0), f)
+    return c.point(67, 481)
+
+
+def bench_projective(repeat=5):
+    results = []
+    for name, P in [('GF(547^2)', extension_curve_point()),
+                    ('GF(2^61-1)', prime_curve_point())]:
+        n = randint(2**59, 2**60)
+        for projective in (False, True):
+            ECPoint.projective = projective
+            label = name + (' jacobian' if projective else ' affine')
+            results.append((label, timed(lambda: (P**n).value, repeat=repeat)[0]))
+    ECPoint.projective = True
+    report('scalar multiplication, 60-bit scalar', results)
+
+
+def double_and_add(x, n):
+    # the recursive square-and-multiply GroupElement.__pow__ used to do
+    if n == 1:
+        return x
+    elif n % 2:
+        return x * double_and_add(x*x, (n-1)//2)
+    else:
+        return double_and_add(x*x, n//2)
+
+
+def bench_pow(repeat=5):
+    results = []
+    P = prime_curve_point()
+    x = IntModP(randint(2, 2**127-2), 2**127-1)
+    for bits in (64, 256):
+        n = randint(2**(bits-1), 2**bits)
+        for name, f in [('double-and-add', double_and_add),
+                        ('sliding window', sliding_window_pow),
+                        ('wNAF', wnaf_pow)]:
+            results.append(('ECPoint {}-bit {}'.format(bits, name),
+                            timed(f, P, n, repeat=repeat)[0]))
+        for name, f in [('double-and-add', double_and_add),
+                        ('sliding window', sliding_window_pow)]:
+            results.append(('IntModP {}-bit {}'.format(bits, name),
+                            timed(f, x, n, repeat=repeat)[0]))
+    report('exponentiation', results)
+
+
+def bench_fixed_base(repeat=20):
+    results = []
+    P = prime_curve_point()
+    x = IntModP(randint(2, 2**127-2), 2**127-1)
+    for name, g in [('ECPoint', P), ('IntModP', x)]:
+        ns = [randint(1, 2**128) for _ in range(repeat)]
+        results.append((name + ' 128-bit, no table',
+                         timed(lambda: [g**n for n in ns])[0] / repeat))
+        for max_size in (256, 4096):
+            results.append(('{} table build, max_size={}'.format(name, max_size),
+                            timed(g.precompute, 128, max_size)[0]))
+            results.append(('{} 128-bit, max_size={}'.format(name, max_size),
+                            timed(lambda: [g**n for n in ns])[0] / repeat))
+    report('fixed-base exponentiation', results)
+
+
+def bench_multi_exp():
+    results = []
+    p = 2**127-1
+    for k in (2, 8, 64, 512, 2048):
+        pairs = [(IntModP(randint(2, p-1), p), randint(1, 2**128)) for _ in range(k)]
+
+        def separate():
+            out = pairs[0][0].identity()
+            for x, n in pairs:
+                out = out * x**n
+            return out
+
+        for name, f in [('separate', separate),
+                         ('straus', lambda: straus(pairs)),
+                         ('pippenger', lambda: pippenger(pairs)),
+                         ('multi_exp', lambda: multi_exp(pairs))]:
+            results.append(('IntModP {} terms {}'.format(k, name), timed(f)[0]))
+    P = prime_curve_point()
+    for k in (2, 8, 32):
+        pairs = [(P**randint(1, 2**60), randint(1, 2**60)) for _ in range(k)]
+        for name, f in [('separate', lambda: [x**n for x, n in pairs]),
+                         ('multi_exp', lambda: multi_exp(pairs))]:
+            results.append(('ECPoint {} terms {}'.format(k, name), timed(f)[0]))
+    report('multi-exponentiation, 128-bit (IntModP) and 60-bit (ECPoint) exponents', results)
+
+
+def bench_memory(count=1000):
+    results = []
+    for name, p, e, q in [('GF(547^2)', 547, 2, [1, 0, 1]),
+                          ('GF((2^61-1)^4)', 2**61-1, 4, [3, 1, 0, 0, 1])]:
+        f = FiniteField(p, e, q)
+        values = [[randint(0, p-1) for _ in range(e)] for _ in range(count)]
+
+        tracemalloc.start()
+        elements = [f.elt(v) for v in values]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results.append((name + ' bytes per element', size / count))
+
+        tracemalloc.start()
+        x = elements[0]
+        for y in elements[1:]:
+            x = x * y + y
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append((name + ' peak bytes in mult/add loop', peak))
+    report('field element memory', results, unit=' B')
+
+
+def bench_prime_field(repeat=5):
+    p = 2**61-1
+    # GF(p) as a quotient of GF(p)[x] by a linear polynomial, as before
+    # FiniteField(p, 1) returned a PrimeField
+    polynomial = object.__new__(FiniteField)
+    polynomial.__init__(p, 1)
+    results = []
+    for name, f in [('polynomial', polynomial), ('PrimeField', FiniteField(p, 1))]:
+        x, y = f.elt(randint(1, p-1)), f.elt(randint(1, p-1))
+        results.append((name + ' mult', timed(lambda: x*y, repeat=1000)[0]))
+        results.append((name + ' inverse', timed(x.inverse, repeat=1000)[0]))
+        P = prime_curve_point(p, f=f)
+        n = randint(2**59, 2**60)
+        results.append((name + ' 60-bit scalar multiplication',
+                         timed(lambda: (P**n).value, repeat=repeat)[0]))
+    report('GF(2^61-1)', results)
+
+
+def bench_tables(repeat=1000):
+    results = []
+    for name, p, e, q in [('GF(5^2)', 5, 2, [2, 0, 1]),
+                          ('GF(7^4)', 7, 4, [3, 4, 2, 6, 1]),
+                          ('GF(547^2)', 547, 2, [1, 0, 1])]:
+        for tables in (False, True):
+            f = FiniteField(p, e, q, tables=tables)
+            label = name + (' tables' if tables else '')
+            if tables:
+                results.append((label + ' build', timed(f.build_tables)[0]))
+            x = f.elt([randint(1, p-1) for _ in range(e)])
+            y = f.elt([randint(1, p-1) for _ in range(e)])
+            n = randint(1, p**e)
+            results.append((label + ' mult', timed(lambda: x*y, repeat=repeat)[0]))
+            results.append((label + ' inverse', timed(x.inverse, repeat=repeat)[0]))
+            results.append((label + ' pow', timed(lambda: x**n, repeat=repeat)[0]))
+            results.append((label + ' order', timed(x.order, repeat=10)[0]))
+    report('log/antilog tables', results)
+
+
+def bench_poly_mul(repeat=200):
+    results = []
+    for p_name, p in [('547', 547), ('2^61-1', 2**61-1), ('2^255-19', 2**255-19)]:
+        for e in (2, 12, 24):
+            f = FiniteField(p, e)
+            x = f.elt([randint(0, p-1) for _ in range(e)])
+            y = f.elt([randint(0, p-1) for _ in range(e)])
+            a, b = list(x.value), list(y.value)
+            label = 'GF(({})^{}) '.format(p_name, e)
+
+            def old():
+                product = trim([c % p for c in schoolbook(a, b)])
+                return poly_divmod(product, f.modulus, p)[1]
+
+            results.append((label + 'schoolbook + division', timed(old, repeat=repeat)[0]))
+            results.append((label + 'karatsuba', timed(karatsuba, a, b, repeat=repeat)[0]))
+            results.append((label + 'kronecker', timed(kronecker, a, b, p, repeat=repeat)[0]))
+            results.append((label + 'field mult', timed(x.mult, y, repeat=repeat)[0]))
+    report('extension field multiplication', results)
+
+
+def bench_inverse(repeat=100):
+    results = []
+    for p_name, p in [('547', 547), ('2^61-1', 2**61-1), ('2^255-19', 2**255-19)]:
+        for e in (2, 4, 12, 24):
+            f = FiniteField(p, e)
+            x = f.elt([randint(0, p-1) for _ in range(e)])
+            label = 'GF(({})^{}) '.format(p_name, e)
+
+            def recursive():
+                a, b, c = extended_euclid(x, f.q)
+                return c.inverse() * a
+
+            results.append((label + 'recursive extended_euclid',
+                            timed(recursive, repeat=repeat)[0]))
+            results.append((label + 'iterative extended Euclid',
+                            timed(poly_inverse, x.value, f.modulus, p, repeat=repeat)[0]))
+            results.append((label + 'Itoh-Tsujii', timed(x.itoh_tsujii, repeat=repeat)[0]))
+    report('extension field inversion', results)
+
+
+def bench_batch(sizes=(8, 100, 1000, 10000, 100000)):
+    results = []
+    p = 2**127-1
+    f = FiniteField(547, 2, [1, 0, 1])
+    for n in sizes:
+        for name, xs in [('IntModP', [IntModP(randint(1, p-1), p) for _ in range(n)]),
+                         ('GF(547^2)', [f.elt([randint(1, 546), randint(0, 546)])
+                                        for _ in range(n)])]:
+            results.append(('{} {} separate inverses'.format(name, n),
+                            timed(lambda: [x.inverse() for x in xs])[0] / n))
+            results.append(('{} {} batch_inverse'.format(name, n),
+                            timed(batch_inverse, xs)[0] / n))
+
+    P = prime_curve_point()
+    Q = P**randint(2**59, 2**60)
+    for n in sizes:
+        # consecutive multiples, normalized so every method starts from affine
+        points = [P]
+        for _ in range(2*n - 1):
+            points.append(points[-1] + Q)
+        ECPoint.batch_normalize(points)
+        pairs = list(zip(points[:n], points[n:]))
+        for projective in (False, True):
+            ECPoint.projective = projective
+            label = 'ECPoint {} separate {} adds'.format(n, 'jacobian' if projective else 'affine')
+            results.append((label, timed(lambda: [(P + Q).value for P, Q in pairs])[0] / n))
+        ECPoint.projective = True
+        results.append(('ECPoint {} batch_add'.format(n), timed(ECPoint.batch_add, pairs)[0] / n))
+    report('batch inversion and addition, time per element', results)
+
+
+def bench_point_counting():
+    results = []
+    for name, p in [('GF(2^16+1)', 2**16+1), ('GF(2^20+7)', 2**20+7)]:
+        c = EllipticCurve((2, 3), FiniteField(p, 1))
+        results.append((name + ' naive count', timed(naive_trace, 2, 3, p)[0]))
+        results.append((name + ' order', timed(c.order)[0]))
+    # secp128r1 and secp160k1 have prime orders, listed to check the count
+    for name, p, a, b, n in [
+            ('GF(2^61-1)', 2**61-1, 2, 3, None),
+            ('GF(2^89-1)', 2**89-1, 2, 3, None),
+            ('secp128r1', 2**128 - 2**97 - 1, 2**128 - 2**97 - 4,
+             0xE87579C11079F43DD824993C2CEE5ED3, 0xFFFFFFFE0000000075A30D1B9038A115),
+            ('secp160k1', 2**160 - 2**32 - 21389, 0, 7,
+             0x0100000000000000000001B8FA16DFAB9ACA16B6B3)]:
+        c = EllipticCurve((a, b), FiniteField(p, 1))
+        elapsed, order = timed(c.order)
+        if n is not None and order != n:
+            raise ArithmeticError('Wrong order for ' + name)
+        results.append((name + ' order', elapsed))
+    report('elliptic curve point counting', results)
+
+
+def bench_memo(calls=3):
+    results = []
+    # a point whose order is the 1000-smooth part of the group order, so
+    # the logs themselves are cheap next to the setup
+    R = prime_curve_point(2**40 + 15)
+    c = R.curve
+    n = c.order()
+    smooth = 1
+    for q, k in c.order_factorisation().items():
+        if q < 1000:
+            smooth *= q**k
+    c.memo.clear()
+    c.element_orders.clear()
+    g = R**(n // smooth)
+    for i in range(calls):
+        x = randint(1, smooth)
+        h = g**x
+        elapsed, y = timed(pohlig_hellman, g, h)
+        if g**y != h:
+            raise ArithmeticError('Wrong discrete log')
+        results.append(('pohlig_hellman call {}'.format(i+1), elapsed))
+    report('repeated discrete logs on a curve over GF(2^40+15)', results)
+    stats = [('{} {}'.format(memo, name), value)
+             for memo, counts in cache_stats(c).items() for name, value in counts.items()]
+    report('cache stats', stats, unit='')
+
+
+def divisor_order(x, fac):
+    # the old order(): try every divisor of the group order, smallest first
+    powers = [range(e+1) for e in [fac[p] for p in sorted(fac.keys())]]
+    candidates = []
+    for p in product(*powers):
+        value = [f**p for f, p in zip(sorted(fac.keys()), p)]
+        out = 1
+        for v in value:
+            out *= v
+        candidates.append(out)
+    for c in sorted(candidates):
+        if x**c == 1:
+            return c
+
+
+def bench_order(repeat=5):
+    results = []
+    groups = []
+    for name, p, e in [('GF(3^12)', 3, 12), ('GF(2^61-1)', 2**61-1, 1), ('GF(7^12)', 7, 12)]:
+        f = FiniteField(p, e)
+        groups.append((name, f.elt([randint(0, p-1) for _ in range(e)]), f.order(),
+                       f.order_factorisation()))
+    P = extension_curve_point()
+    groups.append(('GF(547^2) curve', P, P.curve.order(), P.curve.order_factorisation()))
+    for name, x, n, fac in groups:
+        divisors = 1
+        for k in fac.values():
+            divisors *= k + 1
+        label = '{} ({} divisors) '.format(name, divisors)
+        results.append((label + 'divisors', timed(divisor_order, x, fac, repeat=repeat)[0]))
+        results.append((label + 'strip', timed(element_order, x, n, fac, False, repeat=repeat)[0]))
+        results.append((label + 'tree', timed(element_order, x, n, fac, True, repeat=repeat)[0]))
+    report('element order', results)
+
+
+def trial_division(n, start=2):
+    # the old prime_factorise
+    for i in range(start, int(n**0.5)+1):
+        if n % i == 0:
+            return [i] + trial_division(n//i, start=i)
+    return [n]
+
+
+def bench_factorise():
+    results = []
+    p, q = random_prime(20), random_prime(20)
+    results.append(('40-bit semiprime trial division', timed(trial_division, p*q)[0]))
+    for bits in [(20, 20), (32, 32), (40, 40), (48, 48), (56, 56), (64, 64), (32, 96)]:
+        p, q = random_prime(bits[0]), random_prime(bits[1])
+        elapsed, factors = timed(prime_factorise, p*q)
+        if factors != sorted([p, q]):
+            raise ArithmeticError('Wrong factorisation')
+        results.append(('{}-bit semiprime ({}+{})'.format(sum(bits), *bits), elapsed))
+    p, q = random_prime(32), random_prime(32)
+    results.append(('64-bit semiprime Pollard-Brent only', timed(pollard_brent, p*q)[0]))
+    results.append(('64-bit semiprime ECM only', timed(ecm, p*q)[0]))
+    report('factorisation', results)
+
+
+def bench_primes():
+    results = []
+    p = random_prime(40)
+    results.append(('40-bit prime trial division', timed(trial_division, p)[0]))
+    for bits in [40, 64, 256, 1024, 2048]:
+        p = random_prime(bits)
+        results.append(('{}-bit prime is_prime'.format(bits), timed(is_prime, p, repeat=10)[0]))
+    for bits in [256, 1024, 2048]:
+        results.append(('{}-bit random_prime'.format(bits), timed(random_prime, bits)[0]))
+    for bits in [256, 512, 1024]:
+        results.append(('{}-bit safe_prime'.format(bits), timed(safe_prime, bits)[0]))
+    for L, N in [(1024, 160), (2048, 256)]:
+        results.append(('dsa_parameters({}, {})'.format(L, N), timed(dsa_parameters, L, N)[0]))
+    for bits in [32, 61]:
+        field = FiniteField(random_prime(bits), 1)
+        results.append(('{}-bit prime_order_curve'.format(bits),
+                        timed(prime_order_curve, field)[0]))
+    report('primality and parameter generation', results)
+
+
+def factorise_smooth(values, b):
+    # the old index calculus test: is_b_smooth by a full factorisation, then
+    # factorise again
+    out = []
+    for x in values:
+        out.append(Counter(prime_factorise(x)) if max(prime_factorise(x)) <= b else None)
+    return out
+
+
+def bench_smooth(count=10000):
+    results = []
+    for bits, b in [(32, 300), (40, 900), (64, 5000)]:
+        p = random_prime(bits)
+        values = [randint(1, p-1) for _ in range(count)]
+        primes = eratosthenes(b)
+        label = '{} {}-bit values, b = {} '.format(count, bits, b)
+        if bits <= 40:
+            results.append((label + 'factorise', timed(factorise_smooth, values, b)[0]))
+        results.append((label + 'trial division',
+                        timed(lambda: [is_b_smooth(x, b) for x in values])[0]))
+        results.append((label + 'batch', timed(batch_smooth, values, primes)[0]))
+    report('smoothness', results)
+    results = []
+    for bits in [24, 32, 40]:
+        p = safe_prime(bits)
+        g = primitive_root(p)
+        h = pow(g, randint(1, p-2), p)
+        elapsed, x = timed(index_calculus, g, h, p)
+        if pow(g, x, p) != h:
+            raise ArithmeticError('Wrong discrete log')
+        results.append(('{}-bit p'.format(bits), elapsed))
+    report('index calculus', results)
+
+
+def relation_system(n, m, weight=6):
+    # 4n random sparse relations in n unknowns, like index calculus ones
+    x = [randint(0, m-1) for _ in range(n)]
+    rows = []
+    for _ in range(4*n):
+        row = {randint(0, n-1): randint(1, 3) for _ in range(weight)}
+        rows.append((row, sum(c*x[k] for k, c in row.items()) % m))
+    return rows
+
+
+def bench_sparse():
+    results = []
+    for n in [50, 100, 200, 1000]:
+        rows = relation_system(n, 2**5)
+        if n <= 200:
+            dense = [[row.get(k, 0) for k in range(n)] + [v] for row, v in rows]
+            results.append(('{} unknowns mod 2^5 dense'.format(n),
+                            timed(reduced_row_echelon, dense, 2**5)[0]))
+        results.append(('{} unknowns mod 2^5 sparse'.format(n),
+                        timed(sparse_solve, rows, n, 2**5)[0]))
+    report('relation matrices', results)
+    results = []
+    for bits, b in [(40, 0), (40, 2000), (48, 3000)]:
+        p = safe_prime(bits)
+        g = primitive_root(p)
+        h = pow(g, randint(1, p-2), p)
+        elapsed, x = timed(index_calculus, g, h, p, b)
+        if pow(g, x, p) != h:
+            raise ArithmeticError('Wrong discrete log')
+        results.append(('{}-bit p, {} primes'.format(bits, b and len(eratosthenes(b)) or 'default'),
+                        elapsed))
+    report('index calculus', results)
+
+
+def bench_relations(batches=32):
+    # relation collection throughput for index calculus mod a 48-bit prime
+    results = []
+    p = safe_prime(48)
+    g = primitive_root(p)
+    primes = eratosthenes(3000)
+    tree = product_tree(primes)
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        elapsed, found = timed(lambda: list(islice(relation_batches(g, p, primes, tree, 0, workers),
+                                                   batches)))
+        results.append(('{} workers'.format(workers), sum(map(len, found)) / elapsed))
+    report('index calculus relations per second', results, unit='')
+
+
+def list_bsgs(g, h, order):
+    # the old babystep_giantstep: baby steps in a list, searched per step
+    n = int(order**0.5) + 1
+    powers = [1]
+    for i in range(n-1):
+        powers.append(g * powers[i])
+    y = h
+    inv = g**-n
+    for j in range(n):
+        if y in powers:
+            return j*n+powers.index(y)
+        y = y * inv
+
+
+def bench_bsgs(targets=20):
+    results = []
+    for p in [10007, 1000003, 2**31-1]:
+        g = IntModP(primitive_root(p), p)
+        h = g**randint(1, p-2)
+        label = 'GF({})* '.format(p)
+        if p < 2**20:
+            results.append((label + 'list', timed(list_bsgs, g, h, p-1)[0]))
+        results.append((label + 'dict', timed(babystep_giantstep, g, h, p-1)[0]))
+    P = prime_curve_point()
+    n = 2**32
+    results.append(('curve point, 2^32 range',
+                    timed(babystep_giantstep, P, P**randint(0, n-1), n)[0]))
+    report('baby-step giant-step', results)
+
+    results = []
+    hs = [P**randint(0, n-1) for _ in range(targets)]
+    for size in [2**16, 2**18, 2**20]:
+        elapsed, table = timed(BabySteps, P, n, size)
+        results.append(('table of {} build'.format(size), elapsed))
+        results.append(('table of {} per target'.format(size),
+                        timed(lambda: [table.log(h) for h in hs])[0] / targets))
+    report('reused curve tables, {} targets'.format(targets), results)
+
+
+def interval_bsgs(g, h, lower, upper):
+    return lower + BabySteps(g, upper - lower + 1).log(h * g**-lower)
+
+
+def bench_kangaroo():
+    # logs known to lie in an interval of the given width, in GF(2^61-1)*
+    results = []
+    p = 2**61-1
+    g = IntModP(37, p)
+    for bits in [20, 28, 36, 40, 48]:
+        lower = randint(0, p - 2**bits)
+        x = randint(lower, lower + 2**bits)
+        label = 'width 2^{} '.format(bits)
+        if bits <= 40:
+            elapsed, y = timed(interval_bsgs, g, g**x, lower, lower + 2**bits)
+            if y != x:
+                raise ArithmeticError('Wrong discrete log')
+            results.append((label + 'bsgs', elapsed))
+        elapsed, y = timed(kangaroo, g, g**x, lower, lower + 2**bits)
+        if y != x:
+            raise ArithmeticError('Wrong discrete log')
+        results.append((label + 'kangaroo', elapsed))
+        if bits <= 36:
+            results.append((label + 'kangaroo, 2 workers',
+                            timed(kangaroo, g, g**x, lower, lower + 2**bits, 2)[0]))
+    report('interval discrete logs', results)
+
+
+def bench_rho():
+    results = []
+    for bits in [24, 32, 40, 48]:
+        # the squares mod a safe prime p = 2q + 1 have prime order q
+        p = safe_prime(bits + 1)
+        q = (p - 1) // 2
+        g = IntModP(4, p)
+        x = randint(0, q-1)
+        label = 'GF(p)*, {}-bit order '.format(bits)
+        if bits <= 32:
+            elapsed, y = timed(pollard_rho, g, g**x, _ints_mod_p_shuffle)
+            if g**y != g**x:
+                raise ArithmeticError('Wrong discrete log')
+            results.append((label + 'Floyd', elapsed))
+        for workers in sorted({1, 2, os.cpu_count() or 1}):
+            elapsed, y = timed(rho, g, g**x, q, workers)
+            if y != x:
+                raise ArithmeticError('Wrong discrete log')
+            results.append((label + '{} workers'.format(workers), elapsed))
+    for bits in [32, 40]:
+        E = prime_order_curve(FiniteField(random_prime(bits), 1))
+        P = random_point(E)
+        x = randint(0, E.order() - 1)
+        elapsed, y = timed(rho, P, P**x)
+        if y != x:
+            raise ArithmeticError('Wrong discrete log')
+        results.append(('curve, {}-bit prime order'.format(bits), elapsed))
+    report('rho', results)
+
+
+def bench_ec_rho():
+    results = []
+    cases = []
+    for bits in [32, 40]:
+        E = prime_order_curve(FiniteField(random_prime(bits), 1))
+        cases.append(('{}-bit prime order'.format(bits), random_point(E), E.order()))
+    # y^2 = x^3 + 3x + 1 is defined over GF(7), so over GF(7^11) the Frobenius
+    # map acts on the 28-bit subgroup as multiplication by an eigenvalue
+    F = FiniteField(7, 11)
+    E = EllipticCurve((3, 1), F)
+    q = 164777251
+    while True:
+        x = F.elt([randint(0, 6) for _ in range(11)])
+        rhs = x**3 + E.curve[0]*x + E.curve[1]
+        # 7^11 = 3 mod 4
+        y = rhs**((7**11 + 1) // 4)
+        if not rhs == 0 and y*y == rhs:
+            P = E.point(x, y)**(E.order() // q)
+            if not P.is_identity():
+                break
+    cases.append(('GF(7^11), 28-bit subgroup', P, q))
+    for label, P, n in cases:
+        x = randint(0, n - 1)
+        for name, f in [('rho', rho), ('classes', ec_rho)]:
+            elapsed, y = timed(f, P, P**x, n)
+            if y != x:
+                raise ArithmeticError('Wrong discrete log')
+            results.append(('{} {}'.format(label, name), elapsed))
+    report('ec_rho', results)
+
+
+def bsgs_pohlig_hellman(g, h):
+    # every prime power by BSGS, one after another
+    n, factorisation = g.factored_order()
+    return chinese_remainder_theorem([
+        (discrete_log_pp(g**(n // q**k), h**(n // q**k), q, k), q**k)
+        for q, k in factorisation.items()])[0]
+
+
+def bench_pohlig_hellman(targets=2, memory=2**16):
+    # GF(p)* with p - 1 a product of small prime powers, a 24-bit and a
+    # 40-bit prime; the 40-bit prime's baby steps do not fit in memory
+    while True:
+        n = 2**5 * 3**4 * 101**2 * random_prime(24) * random_prime(40)
+        if is_prime(n + 1):
+            break
+    g = IntModP(primitive_root(n + 1), n + 1)
+    planner = PohligHellman(g, memory)
+    results = []
+    for i in range(targets):
+        x = randint(0, n - 1)
+        elapsed, y = timed(bsgs_pohlig_hellman, g, g**x)
+        if y != x:
+            raise ArithmeticError('Wrong discrete log')
+        results.append(('BSGS, target {}'.format(i+1), elapsed))
+        for workers in sorted({1, 2, os.cpu_count() or 1}):
+            elapsed, y = timed(planner.log, g**x, workers)
+            if y != x:
+                raise ArithmeticError('Wrong discrete log')
+            results.append(('planned, {} workers, target {}'.format(workers, i+1), elapsed))
+    report('pohlig_hellman', results)
+    report('plan', [('{}^{} {}'.format(row['prime'], row['exponent'], row['method']),
+                     row['seconds']) for row in planner.report()])
+
+
+def extension_point(c):
+    # a random point over GF(q) for q = 3 (mod 4)
+    f = c.field
+    q = f.p**f.e
+    while True:
+        x = f.elt([randint(0, f.p - 1) for _ in range(f.e)])
+        y_squared = x**3 + c.curve[0]*x + c.curve[1]
+        y = y_squared**((q + 1) // 4)
+        if y_squared and y*y == y_squared:
+            return c.point(x, y)
+
+
+def supersingular_point(bits):
+    # y^2 = x^3 + x is supersingular over GF(p) for p = 3 (mod 4), so a
+    # prime r | p + 1 has embedding degree 2 and (x, y) -> (-x, iy) is a
+    # distortion map; a point of order r and the map
+    r = random_prime(bits)
+    while True:
+        p = 4*randint(2**13, 2**14)*r - 1
+        if is_prime(p):
+            break
+    f = FiniteField(p, 2, [1, 0, 1])
+    i = f.elt([0, 1])
+    while True:
+        P = prime_curve_point(p, 1, 0, f)**((p + 1) // r)
+        if not P.is_identity():
+            break
+
+    def distortion(R):
+        return P.curve.point(-R.value[0], i*R.value[1])
+
+    return P, r, distortion
+
+
+def mnt_points():
+    # an MNT curve: p = 12l^2 - 1 and r = p + 1 - t prime for t = 6l - 1,
+    # with embedding degree 3; the ate loop is t - 1, half the bits of r.
+    # Points of order r over GF(p) and where the Frobenius acts as p
+    P = prime_curve_point(12338351, 5224928, 1002375, FiniteField(12338351, 3))
+    r = 12332269
+    Q = trace_zero(extension_point(P.curve)**(P.curve.order() // r**2))
+    return P, Q, r
+
+
+def bench_pairing():
+    results = []
+    P, r, distortion = supersingular_point(32)
+    Q = distortion(P)
+    P_3, Q_3, r_3 = mnt_points()
+    for label, A, B, n, pairings in [
+            ('degree 2, 32-bit r', P, Q, r, [('Tate', tate_pairing)]),
+            ('degree 3, 24-bit r', P_3, Q_3, r_3, [('Tate', tate_pairing), ('ate', ate_pairing)])]:
+        elapsed, value = timed(weil_pairing, A, B, n)
+        if value == 1 or value**n != 1:
+            raise ArithmeticError('Weil pairing not an r-th root of unity')
+        results.append(('{} Weil'.format(label), elapsed))
+        for name, pairing in pairings:
+            elapsed, value = timed(pairing, A, B, n)
+            a, b = randint(1, n - 1), randint(1, n - 1)
+            if value == 1 or pairing(A**a, B**b, n) != value**(a*b):
+                raise ArithmeticError('Pairing not bilinear')
+            results.append(('{} {}'.format(label, name), elapsed))
+    x = randint(0, r - 1)
+    elapsed, y = timed(supersingular, P, P**x, distortion)
+    if y != x:
+        raise ArithmeticError('Wrong discrete log')
+    results.append(('MOV, degree 2, 32-bit r', elapsed))
+    report('pairing', results)
+
+
+def bench_prepared(count=20):
+    # count pairings against one fixed point, one at a time, with the fixed
+    # point's lines prepared, and as one product
+    results = []
+    P, r, distortion = supersingular_point(32)
+    P_3, Q_3, r_3 = mnt_points()
+    for label, fixed, points, r, pairing in [
+            ('degree 2 Tate', P, [distortion(P**randint(1, r - 1)) for _ in range(count)], r,
+             tate_pairing),
+            ('degree 3 Tate', P_3, [Q_3**randint(1, r_3 - 1) for _ in range(count)], r_3,
+             tate_pairing),
+            ('degree 3 ate', Q_3, [P_3**randint(1, r_3 - 1) for _ in range(count)], r_3,
+             lambda Q, P, r: ate_pairing(P, Q, r))]:
+        elapsed, values = timed(lambda: [pairing(fixed, Q, r) for Q in points])
+        results.append(('{}, {} points'.format(label, count), elapsed))
+        n = r if pairing is tate_pairing else ate_loop(fixed.curve, r)
+        elapsed, prepared = timed(PreparedPoint, fixed, n)
+        results.append(('{}, prepare'.format(label), elapsed))
+        elapsed, prepared_values = timed(lambda: [pairing(prepared, Q, r) for Q in points])
+        if prepared_values != values:
+            raise ArithmeticError('Prepared pairings differ')
+        results.append(('{}, {} points prepared'.format(label, count), elapsed))
+        if pairing is tate_pairing:
+            product = fixed.curve.field.one
+            for value in values:
+                product = product * value
+            elapsed, value = timed(tate_product, [(prepared, Q) for Q in points], r)
+            if value != product:
+                raise ArithmeticError('Wrong pairing product')
+            results.append(('{}, product of {} prepared'.format(label, count), elapsed))
+    report('prepared pairings', results)
+
+
+BENCHMARKS = {
+    'projective': bench_projective,
+    'pow': bench_pow,
+    'fixed_base': bench_fixed_base,
+    'multi_exp': bench_multi_exp,
+    'memory': bench_memory,
+    'prime_field': bench_prime_field,
+    'tables': bench_tables,
+    'poly_mul': bench_poly_mul,
+    'inverse': bench_inverse,
+    'batch': bench_batch,
+    'point_counting': bench_point_counting,
+    'memo': bench_memo,
+    'order': bench_order,
+    'factorise': bench_factorise,
+    'primes': bench_primes,
+    'smooth': bench_smooth,
+    'sparse': bench_sparse,
+    'relations': bench_relations,
+    'bsgs': bench_bsgs,
+    'kangaroo': bench_kangaroo,
+    'rho': bench_rho,
+    'ec_rho': bench_ec_rho,
+    'pohlig_hellman': bench_pohlig_hellman,
+    'pairing': bench_pairing,
+    'prepared': bench_prepared,
+}
+
+
+if __name__ == '__main__':
+    seed(0)
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
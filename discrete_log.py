@@ -1,119 +1,291 @@
-from math import floor, ceil, sqrt, exp, log
-from random import randint
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import count
+from math import ceil, gcd, isqrt, sqrt, exp, log
+from random import Random, randint
+from time import perf_counter
 import number_theory as nt
+from groups.ecpoint import ECPoint
 from groups.ellipticcurve import EllipticCurve
+from groups.exponentiation import multi_exp
+from groups.pairing import PreparedPoint
+
+
+# candidates tested for smoothness together in index_calculus
+SMOOTHNESS_BATCH = 1000
+
+
+# baby steps kept at most in a BabySteps table; a table holds only the
+# keys, about 100-110 bytes per baby step at peak, so 2^22 is about 450MB
+BSGS_TABLE_SIZE = 2**22
+# giant steps taken between table lookups, so points share one inversion
+GIANT_BATCH = 64
+
+
+class BabySteps():
+    # g^j -> j for j < m, keyed on encode(), built once for a base g and
+    # reused for any number of targets h. A table of m entries leaves
+    # order/m giant steps per target, so a table bigger than sqrt(order)
+    # pays off over many targets; max_size caps it, at the price of more
+    # giant steps
+
+    def __init__(self, g, order=0, size=None, max_size=BSGS_TABLE_SIZE):
+        self.order = order or g.order()
+        self.m = max(1, min(size or isqrt(self.order) + 1, max_size, self.order))
+        # points are normalised together before they are encoded
+        self.normalize = getattr(type(g), 'batch_normalize', None)
+        # the baby steps are made, normalised and encoded GIANT_BATCH at a
+        # time, so only their keys are kept
+        self.table = {}
+        x = g.identity()
+        for start in range(0, self.m, GIANT_BATCH):
+            batch = []
+            for _ in range(min(GIANT_BATCH, self.m - start)):
+                batch.append(x)
+                x = x * g
+            for j, key in enumerate(self.encode(batch), start):
+                self.table.setdefault(key, j)
+        self.giant = x.inverse()
+
+    def encode(self, elements):
+        if self.normalize is not None:
+            self.normalize(elements)
+        return [x.encode() for x in elements]
+
+    def log(self, h):
+        # the least x < order with g^x = h, or None
+        steps = -(-self.order // self.m)
+        y = h
+        for start in range(0, steps, GIANT_BATCH):
+            ys = []
+            for _ in range(min(GIANT_BATCH, steps - start)):
+                ys.append(y)
+                y = y * self.giant
+            for i, key in enumerate(self.encode(ys), start):
+                j = self.table.get(key)
+                if j is not None:
+                    return i*self.m + j
 
 
 def babystep_giantstep(g, h, order=0):  # discrete log problem g^x = h (p)
-    if order == 0:
-        order = g.order()
-    n = floor(sqrt(order)) + 1
-    powers = [1]
-    for i in range(n-1):
-        powers.append(g * powers[i])
-    y = h
-    inv = g**-n
-    for j in range(n):
-        if y in powers:
-            return j*n+powers.index(y)
-        y = y * inv
+    return BabySteps(g, order).log(h)
+
+
+# primes up to this get a table of all q powers of g_i, so every digit is
+# one lookup
+PH_TABLE_BOUND = 2**10
+# rho's expected steps over sqrt(q)
+RHO_STEP_COST = 1.25
+
+
+def plan_prime(q, e, memory=BSGS_TABLE_SIZE):
+    # (method, baby steps, estimated group operations) for the e digits of
+    # a log to a base of order q^e, with at most memory baby steps. A table
+    # of m baby steps costs about m + e q / 2m, least at m = sqrt(e q / 2),
+    # and m = q is a full table. That is about rho's 1.25 e sqrt(q) and the
+    # table serves later targets too, so rho is only picked when memory
+    # caps the table and the giant steps cost more than rho would
+    if q <= min(PH_TABLE_BOUND, memory):
+        return 'table', q, q + e
+    m = min(isqrt(e * q // 2) + 1, memory, q)
+    cost = m + e * q // (2 * m)
+    if m == memory and cost > RHO_STEP_COST * e * isqrt(q):
+        return 'rho', 0, int(RHO_STEP_COST * e * isqrt(q))
+    return ('table' if m == q else 'bsgs'), m, cost
+
+
+def prime_log(g, q, method, size):
+    # a function solving g^d = h for g of order q, by the planned method
+    if method != 'rho':
+        return BabySteps(g, q, size, size).log
+    walk = ec_rho if isinstance(g, ECPoint) else rho
+
+    def log(h):
+        return 0 if h == 1 else walk(g, h, q)
+    return log
+
+
+def prime_power_log(g, h, q, e, log):
+    # x < q^e with g^x = h for g of order q^e, one base q digit at a time;
+    # every digit is log(h_i) to the same base g^(q^(e-1)) of order q
+    x = 0
+    for i in range(e):
+        h_i = multi_exp([(h, q**(e-i-1)), (g, -x*q**(e-i-1))])
+        d = log(h_i)
+        if d is None:
+            return None
+        x += d*q**i
+    return x
 
 
 def discrete_log_pp(g, h, q, e, mov_point=False):  # solves discrete logs for pp order elts
-    coefficients = []
-
-    # for i in range(1, e):
-    #     if pow(g, q**i) == 1:
-    #         e = i
-    #         break
+    return prime_power_log(g, h, q, e, BabySteps(pow(g, q**(e-1)), q).log)
+
+
+def _prime_power_task(g, h, q, e, method, size):
+    start = perf_counter()
+    x = prime_power_log(g, h, q, e, prime_log(g**(q**(e-1)), q, method, size))
+    return x, perf_counter() - start
+
+
+class PohligHellman():
+    # logs to the base g, one subproblem per prime power q^e of g's order:
+    # plan holds (q, e, method, baby steps, estimated group operations)
+    # from plan_prime, and the solver for each prime, with its table, is
+    # built once and kept for every digit and every later target. With
+    # more than one worker the subproblems are solved in a process pool,
+    # most expensive first, and each builds its own table there
+
+    def __init__(self, g, memory=BSGS_TABLE_SIZE):
+        self.g = g
+        self.n, factorisation = g.factored_order()
+        self.plan = [(q, e) + plan_prime(q, e, memory) for q, e in sorted(factorisation.items())]
+        self.solvers = {}
+        # seconds per prime for the last log
+        self.timings = {}
+
+    def log(self, h, workers=1):
+        # the least x with g^x = h, or None
+        parts = [(q, e, method, size, self.g**(self.n // q**e), h**(self.n // q**e))
+                 for q, e, method, size, _ in self.plan]
+        xs = {}
+        if workers == 1:
+            for q, e, method, size, g_q, h_q in parts:
+                start = perf_counter()
+                if q not in self.solvers:
+                    self.solvers[q] = prime_log(g_q**(q**(e-1)), q, method, size)
+                xs[q] = prime_power_log(g_q, h_q, q, e, self.solvers[q])
+                self.timings[q] = perf_counter() - start
+        else:
+            costs = {q: cost for q, _, _, _, cost in self.plan}
+            with ProcessPoolExecutor(workers) as pool:
+                futures = {pool.submit(_prime_power_task, g_q, h_q, q, e, method, size): q
+                           for q, e, method, size, g_q, h_q in
+                           sorted(parts, key=lambda part: -costs[part[0]])}
+                for future, q in futures.items():
+                    xs[q], self.timings[q] = future.result()
+        if None in xs.values():
+            return None
+        return nt.chinese_remainder_theorem([(xs[q], q**e) for q, e, _, _, _ in self.plan])[0]
+
+    def report(self):
+        # the plan and the seconds per subproblem of the last log
+        return [{'prime': q, 'exponent': e, 'method': method, 'baby steps': size,
+                 'estimate': cost, 'seconds': self.timings.get(q)}
+                for q, e, method, size, cost in self.plan]
+
+
+def pohlig_hellman(g, h, mov_point=False, workers=1, memory=BSGS_TABLE_SIZE):
+    return PohligHellman(g, memory).log(h, workers)
+
+
+def relation_batch(g, p, primes, prime_tree, seed):
+    # relations from SMOOTHNESS_BATCH random x with g^x smooth, as
+    # (prime index -> exponent, x), drawn from a generator seeded with seed
+    rng = Random(seed)
+    xs = [rng.randint(1, p-1) for _ in range(SMOOTHNESS_BATCH)]
+    ys = [pow(g, x, p) for x in xs]
+    index = {q: i for i, q in enumerate(primes)}
+    relations = []
+    for x, factorisation in zip(xs, nt.batch_smooth(ys, primes, prime_tree)):
+        if factorisation is not None:
+            relations.append(({index[q]: k for q, k in factorisation.items()}, x))
+    return relations
 
-    for i in range(e):
-        exp = 0
-
-        for j in range(i):
-            exp += coefficients[j]*q**j
-        g_i = pow(g, q**(e-1))
-        h_i = pow(h*pow(g, exp).inverse(), q**(e-i-1))
-        # if mov_point:
-        #     coefficients.append(mov(g_i, h_i, mov_point, q))
-        # else:
-        #     coefficients.append(babystep_giantstep(g_i, h_i, order=q))
-        coefficients.append(babystep_giantstep(g_i, h_i, order=q))
-    x = 0
 
-    for i in range(e):
-        x += coefficients[i]*q**i
+# g, p, the primes and their product tree, set once in each worker process
+_worker_state = None
 
-    return x
 
+def _init_relation_worker(g, p, primes):
+    global _worker_state
+    _worker_state = (g, p, primes, nt.product_tree(primes))
 
-def pohlig_hellman(g, h, mov_point=False):
-    factorisation = nt.prime_factorise(g.order(), counted=True)
-    ys = []
 
-    for q in factorisation.keys():
+def _relation_worker(seed):
+    return relation_batch(*_worker_state, seed)
 
-        order = q**factorisation[q]
-        g_i = pow(g, g.order()//order)
-        h_i = pow(h, g.order()//order)
 
-        ys.append((discrete_log_pp(g_i, h_i, q, factorisation[q], mov_point), order))
+def relation_batches(g, p, primes, prime_tree, seed, workers=1):
+    # batch i is relation_batch with seed + i, in order of i whatever the
+    # number of workers, so the relations depend only on seed. With more
+    # than one worker, a process pool keeps two batches per worker in flight
+    if workers == 1:
+        for i in count():
+            yield relation_batch(g, p, primes, prime_tree, seed + i)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_relation_worker,
+                             initargs=(g, p, primes)) as pool:
+        pending = deque(pool.submit(_relation_worker, seed + i) for i in range(2*workers))
+        try:
+            for i in count(2*workers):
+                batch = pending.popleft().result()
+                pending.append(pool.submit(_relation_worker, seed + i))
+                yield batch
+        finally:
+            for future in pending:
+                future.cancel()
 
-    return nt.chinese_remainder_theorem(ys)[0]
 
-
-def index_calculus(g, h, p, b=0):
+def index_calculus(g, h, p, b=0, workers=1, seed=None):
     if not b:
         b = ceil(exp(sqrt(log(p)*(log(log(p)))))**(1/sqrt(2)))
+    if seed is None:
+        seed = randint(0, 2**64)
     primes = nt.eratosthenes(b)
+    prime_tree = nt.product_tree(primes)
+    index = {q: i for i, q in enumerate(primes)}
     crt_factors = nt.prime_factorise(p-1, counted=True)
     relations = []
 
     # we need to find a number of linearly dependent relations
     # first we'll just find 4 times as many as we need
-    while len(relations) < 4*len(primes):
-        x = randint(1, p-1)
-        y = pow(g, x, p)
-
-        if nt.is_b_smooth(y, b):
-            factorisation = nt.prime_factorise(y, counted=True)
-            relation = [factorisation.get(q, 0) for q in primes] + [x]
-            relations.append(relation)
+    for batch in relation_batches(g, p, primes, prime_tree, seed, workers):
+        relations.extend(batch)
+        if len(relations) >= 4*len(primes):
+            del relations[4*len(primes):]
+            break
 
-    # perform Gaussian elimination on relations modulo each factor
+    # perform sparse Gaussian elimination on relations modulo each factor
     sols = []
 
     for base in sorted(crt_factors.keys()):
         m = base**crt_factors[base]
-        sol = nt.reduced_row_echelon(relations, m)
-        sols.append([sol[i][-1] for i in range(len(sol[0])-1)])
+        sols.append(nt.sparse_solve(relations, len(primes), m))
 
     small_prime_logs = []
 
-    # use the CRT to stitch together the solutions
+    # use the CRT to stitch together the solutions, where the relations
+    # determine the log modulo every factor
     for i in range(len(primes)):
         congruences = []
         for j, base in enumerate(sorted(crt_factors.keys())):
             m = base**crt_factors[base]
             congruences.append((sols[j][i], m))
 
-        small_prime_logs.append(nt.chinese_remainder_theorem(congruences)[0])
+        if any(c is None for c, _ in congruences):
+            small_prime_logs.append(None)
+        else:
+            small_prime_logs.append(nt.chinese_remainder_theorem(congruences)[0])
 
     # have the logs of the small primes
     g_inv = nt.mod_mult_inv(g, p)
-    g_k = g_inv
+    v = h % p
 
-    for k in range(1, p):
-        v = (h * g_k) % p
-        if nt.is_b_smooth(v, b):
-            out = k
-            factors = nt.prime_factorise(v, counted=True)
-            for i, q in enumerate(primes):
-                out += small_prime_logs[i] * factors[q]
+    for start in range(1, p, SMOOTHNESS_BATCH):
+        vs = []
+        for k in range(start, min(start + SMOOTHNESS_BATCH, p)):
+            v = v * g_inv % p
+            vs.append(v)
 
-            return out % (p-1)
+        for k, factors in enumerate(nt.batch_smooth(vs, primes, prime_tree), start):
+            if factors is not None and all(small_prime_logs[index[q]] is not None
+                                           for q in factors):
+                out = k
+                for q, e in factors.items():
+                    out += small_prime_logs[index[q]] * e
 
-        g_k *= g_inv
+                return out % (p-1)
 
 
 def _ints_mod_p_shuffle(x, a, b, g, h):
@@ -142,31 +314,420 @@ def pollard_rho(g, h, f):
             inv, gcd = nt.extended_euclid(v, g.order())[::2]
 
             log_mod_gcd = ((u*inv) % g.order())//gcd
-            reduced = g.p//gcd
+            reduced = g.order()//gcd
 
             for j in range(gcd):
                 if pow(g, log_mod_gcd+j*reduced) == h:
                     return log_mod_gcd+j*reduced
 
 
+# below this interval width kangaroo just uses baby-step giant-step
+KANGAROO_MIN_WIDTH = 2**12
+# kangaroos per worker, half tame and half wild
+KANGAROO_HERD = 8
+# jumps each herd makes between reports of distinguished points
+KANGAROO_STEPS = 1024
+# give up after this many times sqrt(width) jumps in all
+KANGAROO_GIVE_UP = 64
+
+
+def kangaroo_exponents(width, kangaroos):
+    # 2^i for i < k, with mean about kangaroos sqrt(width)/4
+    mean = max(1, kangaroos * isqrt(width) // 4)
+    k = 1
+    while (2**k - 1) // k < mean:
+        k += 1
+    return [2**i for i in range(k)]
+
+
+def kangaroo_jumps(g, exponents):
+    # g^e for each exponent 2^i, by squaring
+    jumps = [g]
+    for _ in exponents[1:]:
+        jumps.append(jumps[-1] * jumps[-1])
+    normalize = getattr(type(g), 'batch_normalize', None)
+    if normalize is not None:
+        normalize(jumps)
+    return jumps
+
+
+def kangaroo_run(g, h, exponents, jumps, D, herd, steps):
+    # each kangaroo in herd is (wild, offset): at g^offset if tame and
+    # h g^offset if wild. Every kangaroo jumps steps times, by the jump its
+    # position's encoding picks; returns the moved herd and the
+    # distinguished points passed, as (kangaroo, encoding, offset)
+    xs = [h * g**o if wild else g**o for wild, o in herd]
+    offsets = [o for _, o in herd]
+    normalize = getattr(type(g), 'batch_normalize', None)
+    k = len(exponents)
+    found = []
+    for _ in range(steps):
+        if normalize is not None:
+            normalize(xs)
+        for i, x in enumerate(xs):
+            key = x.encode()
+            j = key % k
+            if (key // k) % D == 0:
+                found.append((i, key, offsets[i]))
+            xs[i] = x * jumps[j]
+            offsets[i] += exponents[j]
+    return [(wild, o) for (wild, _), o in zip(herd, offsets)], found
+
+
+# the walk function and its fixed arguments, set once in each worker process
+_walk_state = None
+
+
+def _init_walk_worker(run, args):
+    global _walk_state
+    _walk_state = (run, args)
+
+
+def _walk_worker(herd, steps):
+    run, args = _walk_state
+    return run(*args, herd, steps)
+
+
+def walk_rounds(run, args, herds, steps, workers=1):
+    # yields (i, moved herd, distinguished points) as each run(*args,
+    # herds[i], steps) finishes, for ever, one herd per worker; the caller
+    # may change herds[i] before herd i's next round starts
+    if workers == 1:
+        while True:
+            for i, herd in enumerate(herds):
+                yield (i,) + run(*args, herd, steps)
+    with ProcessPoolExecutor(workers, initializer=_init_walk_worker,
+                             initargs=(run, args)) as pool:
+        running = {pool.submit(_walk_worker, herd, steps): i for i, herd in enumerate(herds)}
+        try:
+            while True:
+                for future in wait(running, return_when=FIRST_COMPLETED).done:
+                    i = running.pop(future)
+                    yield (i,) + future.result()
+                    running[pool.submit(_walk_worker, herds[i], steps)] = i
+        finally:
+            for future in running:
+                future.cancel()
+
+
+def kangaroo(g, h, lower, upper, workers=1, herd=KANGAROO_HERD, seed=None):
+    # x in [lower, upper] with g^x = h, or None, in about 2 sqrt(upper -
+    # lower) group operations: van Oorschot and Wiener's parallel version of
+    # Pollard's kangaroos. Tame kangaroos start at known powers of g and
+    # wild ones at h times small powers; all follow the same walk, so a tame
+    # and a wild one that meet go on together to the next distinguished
+    # point, where the log falls out. Only distinguished points are stored,
+    # a few per kangaroo, and workers run a herd each in a process pool
+    width = upper - lower
+    h = h * g**-lower
+    if width < KANGAROO_MIN_WIDTH:
+        # the table searches up to its own ceiling, which may pass width
+        x = BabySteps(g, width + 1).log(h)
+        return None if x is None or x > width else lower + x
+    rng = Random(seed)
+    herd += herd % 2
+    exponents = kangaroo_exponents(width, herd * workers)
+    jumps = kangaroo_jumps(g, exponents)
+    # a kangaroo passes a distinguished point every D jumps or so; meeting
+    # costs up to D jumps per kangaroo before it is seen
+    D = max(1, isqrt(width) // (8 * herd * workers))
+
+    def start(wild):
+        return rng.randint(0, width) - (width // 2 if wild else 0)
+
+    herds = [[(wild, start(wild)) for wild in [False, True] * (herd // 2)]
+             for _ in range(workers)]
+    seen = {}
+    jumped = 0
+    for i, moved, found in walk_rounds(kangaroo_run, (g, h, exponents, jumps, D), herds,
+                                       KANGAROO_STEPS, workers):
+        herds[i] = moved
+        for j, key, offset in found:
+            wild = moved[j][0]
+            if key not in seen:
+                seen[key] = (wild, offset)
+                continue
+            other_wild, other_offset = seen[key]
+            if other_wild != wild:
+                x = other_offset - offset if wild else offset - other_offset
+                if g**x == h:
+                    return lower + x
+            # two of a kind on one path from now on: start one again
+            herds[i][j] = (wild, start(wild))
+        jumped += herd * KANGAROO_STEPS
+        if jumped > KANGAROO_GIVE_UP * isqrt(width):
+            return None
+
+
+# below this order rho just uses baby-step giant-step
+RHO_MIN_ORDER = 2**16
+# Teske's r for r-adding walks
+RHO_MULTIPLIERS = 20
+# walks per worker
+RHO_HERD = 8
+# steps each herd takes between reports of distinguished points
+RHO_STEPS = 1024
+# a walk this many times D steps past its last distinguished point is taken
+# to be in a cycle and restarted
+RHO_STUCK = 20
+# give up after this many times sqrt(order) steps in all
+RHO_GIVE_UP = 64
+
+
+def rho_run(g, h, n, multipliers, coefficients, D, walks, steps):
+    # each walk is (a, b, since) at g^a h^b, since steps past its last
+    # distinguished point. An r-adding step multiplies by the multiplier
+    # g^c h^d its position's encoding picks; returns the moved walks and the
+    # distinguished points passed, as (walk, encoding, a, b)
+    xs = [multi_exp([(g, a), (h, b)]) for a, b, _ in walks]
+    walks = [list(walk) for walk in walks]
+    normalize = getattr(type(g), 'batch_normalize', None)
+    r = len(multipliers)
+    found = []
+    for _ in range(steps):
+        if normalize is not None:
+            normalize(xs)
+        for i, x in enumerate(xs):
+            walk = walks[i]
+            key = x.encode()
+            j = key % r
+            if (key // r) % D == 0:
+                found.append((i, key, walk[0], walk[1]))
+                walk[2] = 0
+            else:
+                walk[2] += 1
+            c, d = coefficients[j]
+            xs[i] = x * multipliers[j]
+            walk[0] = (walk[0] + c) % n
+            walk[1] = (walk[1] + d) % n
+    return [tuple(walk) for walk in walks], found
+
+
+def rho_collision(g, h, n, a_1, b_1, a_2, b_2):
+    # g^a_1 h^b_1 = g^a_2 h^b_2, so (b_2 - b_1) x = a_1 - a_2 (mod n): try
+    # each of the gcd(b_2 - b_1, n) solutions, unless there are too many
+    u, v = (a_1 - a_2) % n, (b_2 - b_1) % n
+    d = gcd(v, n)
+    if u % d or d > RHO_MIN_ORDER:
+        return None
+    x = (u // d) * pow(v // d, -1, n // d) % (n // d)
+    for k in range(d):
+        if g**(x + k*(n // d)) == h:
+            return x + k*(n // d)
+
+
+def rho(g, h, order=0, workers=1, herd=RHO_HERD, seed=None):
+    # x with g^x = h, or None, in about sqrt(pi order / 2) group operations
+    # for any group: Pollard rho with Teske's r-adding walks, which behave
+    # like random walks, and van Oorschot and Wiener's distinguished points.
+    # Walks only report the points whose encoding is distinguished, so
+    # workers each run a herd of walks in a process pool and a collision
+    # table in this process stays small
+    n = order or g.order()
+    if n < RHO_MIN_ORDER:
+        return babystep_giantstep(g, h, n)
+    rng = Random(seed)
+    coefficients = [(rng.randrange(n), rng.randrange(n)) for _ in range(RHO_MULTIPLIERS)]
+    multipliers = [multi_exp([(g, c), (h, d)]) for c, d in coefficients]
+    normalize = getattr(type(g), 'batch_normalize', None)
+    if normalize is not None:
+        normalize(multipliers)
+    # a walk passes a distinguished point every D steps or so; a collision
+    # costs up to D steps before it is seen
+    D = max(1, isqrt(n) // (16 * herd * workers))
+
+    def start():
+        return rng.randrange(n), rng.randrange(n), 0
+
+    walks = [[start() for _ in range(herd)] for _ in range(workers)]
+    seen = {}
+    stepped = 0
+    for i, moved, found in walk_rounds(rho_run, (g, h, n, multipliers, coefficients, D), walks,
+                                       RHO_STEPS, workers):
+        walks[i] = moved
+        for j, key, a, b in found:
+            if key not in seen:
+                seen[key] = (a, b)
+            elif seen[key] != (a, b):
+                x = rho_collision(g, h, n, a, b, *seen[key])
+                if x is not None:
+                    return x
+                walks[i][j] = start()
+        for j, (_, _, since) in enumerate(walks[i]):
+            if since > RHO_STUCK * D:
+                walks[i][j] = start()
+        stepped += herd * RHO_STEPS
+        if stepped > RHO_GIVE_UP * isqrt(n):
+            return None
+
+
+# walks per worker for ec_rho; more walks share each batched inversion
+EC_RHO_HERD = 32
+# r for ec_rho's r-adding walks: a fruitless 2-cycle starts at about 1 step
+# in 2r
+EC_RHO_MULTIPLIERS = 64
+
+
+def frobenius_eigenvalue(P, n):
+    # lambda with frobenius(P) = lambda P, for a point of prime order n on a
+    # curve defined over the prime field, or None
+    curve = P.curve
+    if curve.field.e == 1 or any(c.degree() for c in curve.curve) or not nt.is_prime(n):
+        return None
+    t, p = curve.trace(), curve.field.p
+    disc = (t*t - 4*p) % n
+    if n == 2 or nt.legendre_symbol(disc, n) == -1:
+        return None
+    root = nt.modular_sqrt(disc, n) if disc else 0
+    pi = P.frobenius(1)
+    for s in (root, -root):
+        lam = (t + s) * pow(2, -1, n) % n
+        if P**lam == pi:
+            return lam
+
+
+def point_class(R, n, frobenius):
+    # the representative of R's class {+-pi^i R} with the least encoding,
+    # and f with representative = f R; frobenius is (e, lambda) or None
+    x, y = R.value
+    i, f = 0, 1
+    if frobenius is not None:
+        e, lam = frobenius
+        x_j, key, power = x, x.encode(), 1
+        for j in range(1, e):
+            x_j = x_j.frobenius(1)
+            power = power*lam % n
+            if x_j.encode() < key:
+                i, x, key, f = j, x_j, x_j.encode(), power
+        y = y.frobenius(i)
+    if (-y).encode() < y.encode():
+        y, f = -y, -f % n
+    if i == 0 and f == 1:
+        return R, 1
+    return R.from_affine((x, y), R.curve), f
+
+
+def ec_rho_run(P, Q, n, multipliers, coefficients, D, frobenius, walks, steps):
+    # rho_run on classes of points: each walk is (a, b, since, previous)
+    # at the class of aP + bQ, with previous the encoding of the class two
+    # steps back to catch fruitless 2-cycles, where a step lands back on
+    # -R + M - M. Steps for the whole herd are affine additions sharing one
+    # inversion
+    walks = [list(walk) for walk in walks]
+    xs = []
+    for walk in walks:
+        R = multi_exp([(P, walk[0]), (Q, walk[1])])
+        R, f = point_class(R, n, frobenius) if not R.is_identity() else (R, 1)
+        walk[0], walk[1] = walk[0]*f % n, walk[1]*f % n
+        xs.append(R)
+    r = len(multipliers)
+    found = []
+    for _ in range(steps):
+        keys = [x.encode() for x in xs]
+        sums = P.batch_add([(x, multipliers[key % r]) for x, key in zip(xs, keys)])
+        for i, (x, key, S) in enumerate(zip(xs, keys, sums)):
+            walk = walks[i]
+            if (key // r) % D == 0:
+                found.append((i, key, walk[0], walk[1]))
+                walk[2] = 0
+            else:
+                walk[2] += 1
+            c, d = coefficients[key % r]
+            a, b = walk[0] + c, walk[1] + d
+            if S.is_identity():
+                # aP + bQ = O: a collision with the identity
+                found.append((i, 0, a % n, b % n))
+                S, a, b = P, 1, 0
+            S, f = point_class(S, n, frobenius)
+            a, b = a*f % n, b*f % n
+            if S.encode() == walk[3]:
+                # fruitless 2-cycle: leave it by doubling the smaller point
+                if key < walk[3]:
+                    S, a, b = x, walk[0], walk[1]
+                S, f = point_class(S + S, n, frobenius)
+                a, b = 2*a*f % n, 2*b*f % n
+            walk[3] = key
+            xs[i] = S
+            walk[0], walk[1] = a, b
+    return [tuple(walk) for walk in walks], found
+
+
+def ec_rho(P, Q, order=0, workers=1, herd=EC_RHO_HERD, seed=None):
+    # rho for points, walking on classes {+-R}, and {+-pi^i R} when the
+    # curve is defined over a subfield GF(p) of GF(p^e) so the Frobenius pi
+    # acts on <P> as some lambda: a class of 2 or 2e points leaves about
+    # sqrt(pi order / 4e) steps. Fruitless 2-cycles from the negation map
+    # are escaped by doubling, and longer fruitless cycles are caught by
+    # rho's cycle check
+    n = order or P.order()
+    if n < RHO_MIN_ORDER:
+        return babystep_giantstep(P, Q, n)
+    rng = Random(seed)
+    lam = frobenius_eigenvalue(P, n)
+    frobenius = (P.curve.field.e, lam) if lam is not None else None
+    classes = 2 * (frobenius[0] if frobenius else 1)
+    coefficients = [(rng.randrange(n), rng.randrange(n)) for _ in range(EC_RHO_MULTIPLIERS)]
+    multipliers = [multi_exp([(P, c), (Q, d)]) for c, d in coefficients]
+    P.batch_normalize(multipliers)
+    D = max(1, isqrt(n // classes) // (16 * herd * workers))
+
+    def start():
+        return rng.randrange(n), rng.randrange(n), 0, None
+
+    walks = [[start() for _ in range(herd)] for _ in range(workers)]
+    seen = {0: (0, 0)}
+    stepped = 0
+    args = (P, Q, n, multipliers, coefficients, D, frobenius)
+    for i, moved, found in walk_rounds(ec_rho_run, args, walks, RHO_STEPS, workers):
+        walks[i] = moved
+        for j, key, a, b in found:
+            if key not in seen:
+                seen[key] = (a, b)
+            elif seen[key] != (a, b):
+                x = rho_collision(P, Q, n, a, b, *seen[key])
+                if x is not None:
+                    return x
+                walks[i][j] = start()
+        for j, walk in enumerate(walks[i]):
+            if walk[2] > RHO_STUCK * D:
+                walks[i][j] = start()
+        stepped += herd * RHO_STEPS
+        if stepped > RHO_GIVE_UP * isqrt(n // classes):
+            return None
+
+
 def mov(P, Q, T, l=False):
+    # the log of Q to the base P of order l, moved into the field by the
+    # reduced Tate pairing: T is cut down to a point of order l, whose Miller
+    # loop is prepared once and paired with both P and Q, as
+    # t(T, xP) = t(T, P)^x
     curve = P.curve
-    N = curve.order()
     if not l:
         l = P.order()
-    T = (N//l) * T
-    if T == 0:
+    N = curve.order()
+    while N % l == 0:
+        N //= l
+    T = T**N
+    while not (T**l).is_identity():
+        T = T**l
+    if T.is_identity():
+        raise AttributeError('T of bad order')
+    T = PreparedPoint(T, l)
+    a = curve.tate_pairing(T, P, l)
+    if a == 1:
         raise AttributeError('T of bad order')
-    a = curve.weil_pairing(P, T, l)
-    b = curve.weil_pairing(Q, T, l)
-    return babystep_giantstep(a, b, N)
+    b = curve.tate_pairing(T, Q, l)
+    return babystep_giantstep(a, b, l)
 
 
 def supersingular(P, Q, d):
+    # d a distortion map, so d(P) is outside <P>
     c = P.curve
-    e_1 = c.weil_pairing(P, d(P), P.order())
-    e_2 = c.weil_pairing(P, d(Q), P.order())
-    return babystep_giantstep(e_1, e_2)
+    n = P.order()
+    prepared = PreparedPoint(P, n)
+    e_1 = c.tate_pairing(prepared, d(P), n)
+    e_2 = c.tate_pairing(prepared, d(Q), n)
+    return babystep_giantstep(e_1, e_2, n)
 
 
 if __name__ == '__main__':
@@ -1,15 +1,21 @@
-from copy import deepcopy
 from groups.groupelement import GroupElement
-from number_theory import prime_factorise
-from itertools import product
+from groups.fieldelement import batch_inverse
+from groups.order import element_order
 
 
 class ECPoint(GroupElement):
+    __slots__ = ('curve', 'jacobian', '_value', 'table')
     id_value = 0
     test = False
+    # keep points in Jacobian coordinates (X, Y, Z) ~ (X/Z^2, Y/Z^3) so that
+    # the group law needs no field inversions; set to False for the affine law
+    projective = True
+    cheap_inverse = True
 
     def __init__(self, value, curve):
         a, b = curve.curve
+        self.curve = curve
+        self.table = None
         if value != 0:
             x, y = value
             if y**2 != x**3 + a*x + b:
@@ -17,25 +23,86 @@ class ECPoint(GroupElement):
             self.value = (x, y)
         else:
             self.value = 0
-        self.curve = curve
-        self.curve.field = self.curve.field
+
+    @classmethod
+    def from_jacobian(cls, jacobian, curve):
+        # trusted constructor for results of the group law: no curve check
+        new = cls.__new__(cls)
+        new.curve = curve
+        new.jacobian = jacobian
+        new._value = None if jacobian else 0
+        new.table = None
+        return new
+
+    @classmethod
+    def from_affine(cls, value, curve):
+        new = cls.from_jacobian((value[0], value[1], curve.field.one), curve)
+        new._value = value
+        return new
+
+    @property
+    def value(self):
+        if self._value is None:
+            X, Y, Z = self.jacobian
+            z_inv = Z.inverse()
+            z_inv_2 = z_inv*z_inv
+            self._value = (X*z_inv_2, Y*z_inv_2*z_inv)
+            self.jacobian = self._value + (self.curve.field.one,)
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        if value == 0:
+            self.jacobian = None
+        else:
+            self.jacobian = (value[0], value[1], self.curve.field.one)
+
+    def is_identity(self):
+        return self.jacobian is None
+
+    def identity(self):
+        return ECPoint(0, self.curve)
 
     def __eq__(self, other):
-        if other == 1 or other == 0:
-            return self.id_value == self.value
+        if isinstance(other, int):
+            if other == 1 or other == 0:
+                return self.is_identity()
+            return False
         elif self.curve != other.curve:
             raise ArithmeticError('Points on different curves')
+        elif self.is_identity() or other.is_identity():
+            return self.is_identity() and other.is_identity()
+        elif self._value is not None and other._value is not None:
+            return self._value == other._value
         else:
-            return self.value == other.value
+            # compare X_1 Z_2^2 = X_2 Z_1^2 and Y_1 Z_2^3 = Y_2 Z_1^3
+            X_1, Y_1, Z_1 = self.jacobian
+            X_2, Y_2, Z_2 = other.jacobian
+            Z_1Z_1, Z_2Z_2 = Z_1*Z_1, Z_2*Z_2
+            return (X_1*Z_2Z_2 == X_2*Z_1Z_1 and
+                    Y_1*Z_2*Z_2Z_2 == Y_2*Z_1*Z_1Z_1)
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def encode(self):
+        # 0 for the identity, 1 + x + qy for (x, y) over a field of size q
+        if self.is_identity():
+            return 0
+        x, y = self.value
+        return 1 + x.encode() + y.encode() * self.curve.field.p**self.curve.field.e
 
     def operate(self, other):
-        if str(self.curve) != str(other.curve):
+        if self.curve is not other.curve and str(self.curve) != str(other.curve):
             raise ArithmeticError('Different curves')
 
-        if self.value == 0:
+        if self.is_identity():
             return other
-        elif other.value == 0:
+        elif other.is_identity():
             return self
+        elif self.projective:
+            return self._jacobian_add(other)
         else:
             x_1, x_2 = self.value[0], other.value[0]
             y_1, y_2 = self.value[1], other.value[1]
@@ -52,33 +119,127 @@ class ECPoint(GroupElement):
             y_3 = m*(x_1-x_3) - y_1
             return ECPoint((x_3, y_3), self.curve)
 
+    @staticmethod
+    def batch_normalize(points):
+        # convert Jacobian points to affine with a single field inversion
+        pending = list({id(P): P for P in points if P._value is None}.values())
+        z_invs = batch_inverse([P.jacobian[2] for P in pending])
+        for P, z_inv in zip(pending, z_invs):
+            X, Y, _ = P.jacobian
+            z_inv_2 = z_inv*z_inv
+            P._value = (X*z_inv_2, Y*z_inv_2*z_inv)
+            P.jacobian = P._value + (P.curve.field.one,)
+        return points
+
+    @staticmethod
+    def batch_add(pairs):
+        # [P + Q for P, Q in pairs] by the affine law, sharing one inversion
+        # between all the slopes
+        ECPoint.batch_normalize([P for pair in pairs for P in pair])
+        out = [None] * len(pairs)
+        todo, numerators, denominators = [], [], []
+        for i, (P, Q) in enumerate(pairs):
+            if P.curve is not Q.curve and str(P.curve) != str(Q.curve):
+                raise ArithmeticError('Different curves')
+            if P.is_identity():
+                out[i] = Q
+                continue
+            elif Q.is_identity():
+                out[i] = P
+                continue
+            (x_1, y_1), (x_2, y_2) = P.value, Q.value
+            if x_1 != x_2:
+                numerators.append(y_2 - y_1)
+                denominators.append(x_2 - x_1)
+            elif y_1 + y_2 == 0:
+                out[i] = ECPoint(0, P.curve)
+                continue
+            else:
+                numerators.append(3*x_1*x_1 + P.curve.curve[0])
+                denominators.append(y_1 + y_1)
+            todo.append(i)
+
+        for i, m_numerator, inv in zip(todo, numerators, batch_inverse(denominators)):
+            P, Q = pairs[i]
+            (x_1, y_1), (x_2, _) = P.value, Q.value
+            m = m_numerator * inv
+            x_3 = m*m - x_1 - x_2
+            y_3 = m*(x_1 - x_3) - y_1
+            out[i] = ECPoint.from_affine((x_3, y_3), P.curve)
+        return out
+
+    def _jacobian_add(self, other):
+        X_1, Y_1, Z_1 = self.jacobian
+        X_2, Y_2, Z_2 = other.jacobian
+        Z_1Z_1 = Z_1*Z_1
+        Z_2Z_2 = Z_2*Z_2
+        U_1 = X_1*Z_2Z_2
+        U_2 = X_2*Z_1Z_1
+        S_1 = Y_1*Z_2*Z_2Z_2
+        S_2 = Y_2*Z_1*Z_1Z_1
+        H = U_2 - U_1
+        r = S_2 - S_1
+        if not H:
+            if not r:
+                return self._jacobian_double()
+            return ECPoint(0, self.curve)
+        HH = H*H
+        HHH = H*HH
+        V = U_1*HH
+        X_3 = r*r - HHH - (V + V)
+        Y_3 = r*(V - X_3) - S_1*HHH
+        Z_3 = Z_1*Z_2*H
+        return ECPoint.from_jacobian((X_3, Y_3, Z_3), self.curve)
+
+    def _jacobian_double(self):
+        X, Y, Z = self.jacobian
+        if not Y:
+            return ECPoint(0, self.curve)
+        a = self.curve.curve[0]
+        XX = X*X
+        YY = Y*Y
+        ZZ = Z*Z
+        S = X*YY
+        S = S + S
+        S = S + S
+        M = XX + XX + XX
+        if a:
+            M = M + a*ZZ*ZZ
+        X_3 = M*M - (S + S)
+        YYYY = YY*YY
+        YYYY = YYYY + YYYY
+        YYYY = YYYY + YYYY
+        Y_3 = M*(S - X_3) - (YYYY + YYYY)
+        Z_3 = Y*Z
+        Z_3 = Z_3 + Z_3
+        return ECPoint.from_jacobian((X_3, Y_3, Z_3), self.curve)
+
     def inverse(self):
-        if self.value == 0:
+        if self.is_identity():
             return self
-        else:
+        elif self._value is not None:
             new_value = (self.value[0], -self.value[1])
             return ECPoint(new_value, self.curve)
+        else:
+            X, Y, Z = self.jacobian
+            return ECPoint.from_jacobian((X, -Y, Z), self.curve)
 
     def order(self):
-        group_order = self.curve.order()
-        fac = prime_factorise(group_order, counted=True)
-        powers = [range(e+1) for e in [fac[p] for p in sorted(fac.keys())]]
-        candidates = []
-        for p in product(*powers):
-            value = [f**p for f, p in zip(sorted(fac.keys()), p)]
-            out = 1
-            for v in value:
-                out *= v
-            candidates.append(out)
-        for c in sorted(candidates):
-            if self**c == 0:
-                return c
+        return self.factored_order()[0]
+
+    def factored_order(self):
+        if self.is_identity():
+            return 1, {}
+        curve = self.curve
+        return curve.element_orders.get(self.value, lambda: element_order(
+            self, curve.order(), curve.order_factorisation()))
 
     def frobenius(self, n):
-        new = deepcopy(self)
-        for i in range(n):
-            new.value = (new.value[0]**self.curve.field.p, new.value[1]**self.curve.field.p)
-        return new
+        if self.is_identity():
+            return self
+        x, y = self.value
+        return ECPoint.from_jacobian((x.frobenius(n), y.frobenius(n), self.curve.field.one),
+                                     self.curve)
 
     def __mod__(self, q):
         return self.value[0] % q
@@ -113,4 +274,3 @@ class ECPoint(GroupElement):
     #         if v != 0:
     #             out += super(ECPoint, self.frobenius(n)).__pow__(v)
     #     return out
-
@@ -1,7 +1,12 @@
-from cmath import sqrt
 from random import randint
 import number_theory as nt
+from groups import pairing
 from groups.ecpoint import ECPoint
+from groups.finitefield import FiniteField
+import groups.memo as memo
+from groups.memo import Memo
+from groups.pointcounting import (NAIVE_BOUND, bsgs_trace, extension_order, frobenius_trace,
+                                  quadratic_twist, schoof)
 
 
 def weierstrass(curve):
@@ -17,12 +22,15 @@ def weierstrass(curve):
 class EllipticCurve():
     def __init__(self, curve, field):
         self.field = field
+        # orders and factorisations, which take a point count to find
+        self.memo = Memo()
+        self.element_orders = Memo(memo.ELEMENT_ORDER_CACHE_SIZE)
         if len(curve) > 2:
             self.curve = weierstrass(curve)
             self.curve = list(field.elt([i]) for i in curve)
         else:
             self.curve = list(field.elt([i]) for i in curve)
-        if self.field.p in self.bad_reduction_primes():
+        if self.discriminant() % self.field.p == 0:
             print('Warning: over the field ' + str(field) +
                   ', this field has ' + self.reduction_type())
 
@@ -34,35 +42,46 @@ class EllipticCurve():
             y = y.value
             return ECPoint((self.field.elt(x), self.field.elt(y)), self)
 
-    def order(self, base_field=False):
-        a, b = self.curve[0].value[0].value, self.curve[1].value[0].value
+    def trace(self):
+        # trace of the p-power Frobenius, t = p + 1 - #E(GF(p)), for a curve
+        # with coefficients in GF(p)
+        a, b = self.curve[0].value[0], self.curve[1].value[0]
         p = self.field.p
-        e = self.field.e
-        if base_field:
-            count = 1
-            for x in range(p):
-                y_squared = (x**3+a*x+b) % p
-                if y_squared == 0:
-                    count += 1
-                elif nt.legendre_symbol(y_squared, p) == 1:
-                    count += 2
-            return count
-        else:
-            base_order = self.order(True)
-            t = p + 1 - base_order
-            a = (t + sqrt(t**2 - 4*p))/2
-            b = (t - sqrt(t**2 - 4*p))/2
-            return round((1 + p**e - a**e - b**e).real)
+        if self.field.e == 1:
+            return self.memo.get('trace', lambda: frobenius_trace(self))
+        return self.memo.get('trace', lambda: EllipticCurve((a, b), FiniteField(p, 1)).trace())
+
+    def order(self, base_field=False):
+        e = 1 if base_field else self.field.e
+        return self.memo.get(('order', e),
+                             lambda: extension_order(self.field.p, self.trace(), e))
+
+    def order_factorisation(self, base_field=False):
+        # prime -> exponent in the order
+        e = 1 if base_field else self.field.e
+        return self.memo.get(('factorisation', e),
+                             lambda: nt.prime_factorise(self.order(base_field), counted=True))
+
+    def cofactors(self, base_field=False):
+        # prime q -> order / q^k, where q^k exactly divides the order: the
+        # power that maps the group onto its q-part
+        e = 1 if base_field else self.field.e
+        n = self.order(base_field)
+        return self.memo.get(('cofactors', e), lambda: {
+            q: n // q**k for q, k in self.order_factorisation(base_field).items()})
+
+    def discriminant(self):
+        a, b = self.curve[0].value[0], self.curve[1].value[0]
+        return 4*a**3+27*b**2
 
     def bad_reduction_primes(self):
-        a, b = self.curve[0].value[0].value, self.curve[1].value[0].value
-        d = 4*a**3+27*b**2
+        d = self.discriminant()
         if d == 0:
             return [self.field.p]
         return set(nt.prime_factorise(abs(d)))
 
     def reduction_type(self):
-        if self.field.p in self.bad_reduction_primes():
+        if self.discriminant() % self.field.p == 0:
             if self.curve[0] == 0:
                 return 'bad (additive) reduction'
             else:
@@ -70,80 +89,14 @@ class EllipticCurve():
         else:
             return 'good reduction'
 
-    def weil_pairing(self, P, Q):
-        m = P.order()
-        assert(m == Q.order())
-
-        def g(R, S):
-            x_1, y_1 = R.value
-            x_2, y_2 = S.value
-            if R == -S:
-                def h(T):
-                    return T.value[0] - x_1
-            else:
-                if R == S:
-                    m = (3*x_1**2 + self.curve[0]) * (2*y_1).inverse()
-                else:
-                    m = (y_2 - y_1)*(x_2 - x_1).inverse()
-
-                def h(T):
-                    num = T.value[1] - y_1 - m*(T.value[0] - x_1)
-                    den = T.value[0] + x_1 + x_2 - m**2
-
-                    if not den.inverse() and num == 0:
-                        return self.field.elt(1)
-                    elif not den.inverse():
-                        return 'inf'
-                    return num * den.inverse()
-            return h
-
-        binary_m = bin(m)
-        n = len(binary_m) - 2
-        ms = [int(binary_m[i]) for i in range(n+1, 1, -1)]
-
-        def f(R, x):
-            if R == x:
-                return self.field.elt(0)
-            T = R
-            ops = []
-            for i in range(n-2, -1, -1):
-                ops.append((True, 2))
-                ops.append((False, T, T))
-                T = T+T
-                if ms[i] == 1:
-                    ops.append((False, T, R))
-                    T = T+R
-            out = self.field.elt(1)
-
-            for op in ops:
-                if op[0]:
-                    out = out**2
-                else:
-                    # zeroes and infinity cancel
-                    if type(g(op[1], op[2])(x)) is str or g(op[1], op[2])(x) == 0:
-                        continue
-                    out = (out * g(op[1], op[2])(x))
-            return out
-
-        a, b = self.curve[0].value[0].value, self.curve[1].value[0].value
-        x = randint(1, self.field.p)
-
-        while True:
-            x = randint(1, self.field.p)
-            f_x = self.field.elt(x)
-            if f_x == P.value[0] or f_x == -Q.value[0]:
-                continue
-            elif P-Q != 0 and f_x == (P-Q).value[0]:
-                continue
-            elif nt.legendre_symbol(x**3+a*x+b, self.field.p) != 1:
-                continue
-            y = nt.modular_sqrt(x**3+a*x+b, self.field.p)
-            S = self.point(x, y)
+    def weil_pairing(self, P, Q, m=None):
+        return pairing.weil_pairing(P, Q, m)
 
-            break
+    def tate_pairing(self, P, Q, r=None):
+        return pairing.tate_pairing(P, Q, r)
 
-        out = f(P, Q+S)*f(P, S).inverse() * (f(Q, P-S)*f(Q, -S).inverse()).inverse()
-        return out
+    def ate_pairing(self, P, Q, r=None):
+        return pairing.ate_pairing(P, Q, r)
 
     def __repr__(self):
         out = 'y^2=x^3'
@@ -155,8 +108,35 @@ class EllipticCurve():
         return 'Elliptic curve ' + out + ' over ' + str(self.field)
 
 
+def prime_order_curve(field):
+    # a random curve over a prime field with a prime number of points, or
+    # the quadratic twist of one. Schoof gives up on a curve as soon as some
+    # small l divides both p + 1 - t and p + 1 + t
+    p = field.p
+    while True:
+        a, b = randint(0, p-1), randint(0, p-1)
+        if (4*a**3 + 27*b*b) % p == 0:
+            continue
+        curve = EllipticCurve((a, b), field)
+        if p < NAIVE_BOUND:
+            t = curve.trace()
+        else:
+            alive = {1, -1}
 
+            def abort(t_l, l):
+                for sign in list(alive):
+                    if (p + 1 - sign*t_l) % l == 0:
+                        alive.discard(sign)
+                return not alive
 
-
-
-
+            residue = schoof(a, b, p, abort)
+            if residue is None:
+                continue
+            t = bsgs_trace(curve, *residue)
+        if nt.is_prime(p + 1 - t):
+            curve.memo.get('trace', lambda: t)
+            return curve
+        elif nt.is_prime(p + 1 + t):
+            twist = quadratic_twist(curve)
+            twist.memo.get('trace', lambda: -t)
+            return twist
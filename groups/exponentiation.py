@@ -0,0 +1,260 @@
+def window_size(bits, signed=False):
+    # choose w to minimise precomputation + the expected number of
+    # multiplications in the main loop, roughly bits / (w + 1)
+    best, best_cost = 1, bits
+    for w in range(2, 9):
+        table = 2**(w-2) if signed else 2**(w-1)
+        cost = table + bits / (w + 1)
+        if cost < best_cost:
+            best, best_cost = w, cost
+    return best
+
+
+def wnaf(n, w):
+    # width-w non-adjacent form of n > 0, least significant digit first:
+    # every non-zero digit is odd, |d| < 2^(w-1), and is followed by w-1 zeroes
+    digits = []
+    modulus = 1 << w
+    while n:
+        if n & 1:
+            d = n % modulus
+            if d >= modulus >> 1:
+                d -= modulus
+            n -= d
+        else:
+            d = 0
+        digits.append(d)
+        n >>= 1
+    return digits
+
+
+def sliding_digits(n, w):
+    # sliding window recoding of n > 0, least significant digit first: every
+    # non-zero digit is odd, < 2^w, and is followed by at least w-1 zeroes
+    digits = [0] * n.bit_length()
+    i = n.bit_length() - 1
+    while i >= 0:
+        if (n >> i) & 1:
+            j = max(i - w + 1, 0)
+            while not (n >> j) & 1:
+                j += 1
+            digits[j] = (n >> j) & ((1 << (i - j + 1)) - 1)
+            i = j - 1
+        else:
+            i -= 1
+    return digits
+
+
+def odd_powers(x, count):
+    # [x, x^3, x^5, ..., x^(2*count-1)]
+    table = [x]
+    if count > 1:
+        x_2 = x.operate(x)
+        for _ in range(count - 1):
+            table.append(table[-1].operate(x_2))
+    return table
+
+
+def sliding_window_pow(x, n, w=None):
+    if w is None:
+        w = window_size(n.bit_length())
+    table = odd_powers(x, 1 << (w-1))
+    out = None
+    i = n.bit_length() - 1
+    while i >= 0:
+        if not (n >> i) & 1:
+            out = out.operate(out)
+            i -= 1
+            continue
+        # longest window n[i..j] of at most w bits that ends in a one
+        j = max(i - w + 1, 0)
+        while not (n >> j) & 1:
+            j += 1
+        window = (n >> j) & ((1 << (i - j + 1)) - 1)
+        if out is not None:
+            for _ in range(i - j + 1):
+                out = out.operate(out)
+            out = out.operate(table[window >> 1])
+        else:
+            out = table[window >> 1]
+        i = j - 1
+    return out
+
+
+def wnaf_pow(x, n, w=None):
+    if w is None:
+        w = window_size(n.bit_length(), signed=True)
+    w = max(w, 2)
+    table = odd_powers(x, 1 << (w-2))
+    negatives = [t.inverse() for t in table]
+    out = None
+    for d in reversed(wnaf(n, w)):
+        if out is not None:
+            out = out.operate(out)
+        if d > 0:
+            out = table[d >> 1] if out is None else out.operate(table[d >> 1])
+        elif d < 0:
+            out = negatives[-d >> 1] if out is None else out.operate(negatives[-d >> 1])
+    return out
+
+
+class FixedBaseTable():
+    # fixed-window table of x^(d * 2^(w*i)) for every digit d and window i,
+    # so that x^n costs one lookup and multiplication per non-zero digit
+    max_size = 2**12
+
+    def __init__(self, base, max_bits, max_size=None):
+        if max_size is None:
+            max_size = self.max_size
+        self.signed = base.cheap_inverse
+        self.max_bits = max_bits
+        self.w = 0
+        for w in range(1, 17):
+            if self.windows(w) * self.digits(w) > max_size:
+                break
+            self.w = w
+        if not self.w:
+            raise ValueError('A table for {} bits needs more than {} elements'
+                             .format(max_bits, max_size))
+
+        self.rows = []
+        row_base = base
+        for _ in range(self.windows(self.w)):
+            row = [row_base]
+            for _ in range(self.digits(self.w) - 1):
+                row.append(row[-1].operate(row_base))
+            self.rows.append(row)
+            for _ in range(self.w):
+                row_base = row_base.operate(row_base)
+
+    def windows(self, w):
+        # signed digits can carry into one extra window
+        return -(-self.max_bits // w) + self.signed
+
+    def digits(self, w):
+        return 2**(w-1) if self.signed else 2**w - 1
+
+    def __len__(self):
+        return sum(len(row) for row in self.rows)
+
+    def power(self, n):
+        out = None
+        modulus = 1 << self.w
+        for row in self.rows:
+            d = n % modulus
+            if self.signed and d > modulus >> 1:
+                d -= modulus
+            n = (n - d) >> self.w
+            if d > 0:
+                y = row[d-1]
+            elif d < 0:
+                y = row[-d-1].inverse()
+            else:
+                continue
+            out = y if out is None else out.operate(y)
+        if out is None:
+            return self.rows[0][0].identity()
+        return out
+
+
+def power(x, n):
+    if x.table is not None and abs(n).bit_length() <= x.table.max_bits:
+        out = x.table.power(abs(n))
+        return out if n >= 0 else out.inverse()
+    elif n < 0:
+        return power(x.inverse(), -n)
+    elif n == 0:
+        return x.identity()
+    elif n == 1:
+        return x
+    elif x.cheap_inverse:
+        return wnaf_pow(x, n)
+    else:
+        return sliding_window_pow(x, n)
+
+
+def straus(pairs, w=None):
+    # interleaved windowed exponentiation: one shared chain of squarings,
+    # with each base multiplied in at the odd digits of its own recoding
+    bits = max(n.bit_length() for _, n in pairs)
+    signed = all(x.cheap_inverse for x, _ in pairs)
+    if w is None:
+        w = window_size(bits, signed)
+    if signed:
+        w = max(w, 2)
+    # schedule[i] lists the table entries to multiply in after squaring i
+    schedule = [[] for _ in range(bits + 1)]
+    for x, n in pairs:
+        if signed:
+            table = odd_powers(x, 1 << (w-2))
+            negatives = [t.inverse() for t in table]
+            for i, d in enumerate(wnaf(n, w)):
+                if d:
+                    schedule[i].append(table[d >> 1] if d > 0 else negatives[-d >> 1])
+        else:
+            table = odd_powers(x, 1 << (w-1))
+            for i, d in enumerate(sliding_digits(n, w)):
+                if d:
+                    schedule[i].append(table[d >> 1])
+
+    out = None
+    for ys in reversed(schedule):
+        if out is not None:
+            out = out.operate(out)
+        for y in ys:
+            out = y if out is None else out.operate(y)
+    return out
+
+
+def pippenger(pairs, c=None):
+    # bucket method: per window of c bits, add each base into the bucket of
+    # its digit, then combine the buckets with a running sum
+    bits = max(n.bit_length() for _, n in pairs)
+    if c is None:
+        c = max(1, len(pairs).bit_length() - 2)
+    out = None
+    for start in range(c * ((bits - 1) // c), -1, -c):
+        if out is not None:
+            for _ in range(c):
+                out = out.operate(out)
+        buckets = [None] * (1 << c)
+        for x, n in pairs:
+            d = (n >> start) & ((1 << c) - 1)
+            if d:
+                buckets[d] = x if buckets[d] is None else buckets[d].operate(x)
+        running = total = None
+        for bucket in reversed(buckets[1:]):
+            if bucket is not None:
+                running = bucket if running is None else running.operate(bucket)
+            if running is not None:
+                total = running if total is None else total.operate(running)
+        if total is not None:
+            out = total if out is None else out.operate(total)
+    return out
+
+
+def multi_exp(pairs):
+    # product of x^n over (x, n) in pairs; the identity when every n is 0
+    if not pairs:
+        raise ValueError('multi_exp needs at least one base')
+    identity = pairs[0][0].identity()
+    pairs = [(x, n) if n > 0 else (x.inverse(), -n) for x, n in pairs if n]
+    if not pairs:
+        return identity
+    elif len(pairs) == 1:
+        return power(*pairs[0])
+
+    # estimated multiplications: Straus pays for a table per base, Pippenger
+    # for summing 2^c buckets per window, but the first base dropped into
+    # each bucket is free
+    bits = max(n.bit_length() for _, n in pairs)
+    k = len(pairs)
+    w = window_size(bits, pairs[0][0].cheap_inverse)
+    c = max(1, k.bit_length() - 2)
+    used_buckets = 2**c * (1 - (1 - 2**-c)**k)
+    straus_cost = bits + k * (bits / (w + 1) + 2**(w-1))
+    pippenger_cost = -(-bits // c) * (k - used_buckets + 2**(c+1) + c)
+    if straus_cost <= pippenger_cost:
+        return straus(pairs)
+    else:
+        return pippenger(pairs, c)
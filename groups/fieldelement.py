@@ -3,6 +3,8 @@ from copy import deepcopy
 
 
 class FieldElement(GroupElement):
+    __slots__ = ()
+
     def __neg__(self):
         return self.add_inverse()
 
@@ -19,8 +21,8 @@ class FieldElement(GroupElement):
         return self.mult_inverse()
 
     def __mul__(self, other):
-        if other is 1:
-            return self
+        if isinstance(other, int):
+            return other * self
         return self.mult(other)
 
     def __rmul__(self, other):
@@ -33,12 +35,12 @@ class FieldElement(GroupElement):
         return self.add(other)
 
     def add_identity(self):
-        new = deepcopy(self)
+        new = deepcopy(self, {id(self.table): None})
         new.value = new.add_id_value
         return new
 
     def mult_identity(self):
-        new = deepcopy(self)
+        new = deepcopy(self, {id(self.table): None})
         new.value = new.mult_id_value
         return new
 
@@ -69,4 +71,31 @@ class FieldElement(GroupElement):
             return self.value == other.value
 
     def __mod__(self, other):
-        return divmod(self, other)[1]
\ No newline at end of file
+        return divmod(self, other)[1]
+
+
+def batch_inverse(elements):
+    # Montgomery's trick: invert the product of all the elements once, then
+    # peel off each inverse, for one inversion and 3(n-1) multiplications.
+    # Zeroes are left as they are, like inverse() does
+    prefix = []
+    product = None
+    for x in elements:
+        if x:
+            product = x if product is None else product * x
+        prefix.append(product)
+    if product is None:
+        return list(elements)
+
+    inv = product.inverse()
+    out = [None] * len(elements)
+    for i in range(len(elements) - 1, -1, -1):
+        x = elements[i]
+        if not x:
+            out[i] = x
+        elif i and prefix[i-1] is not None:
+            out[i] = inv * prefix[i-1]
+            inv = inv * x
+        else:
+            out[i] = inv
+    return out
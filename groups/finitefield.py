@@ -1,36 +1,97 @@
 from groups.fieldelement import FieldElement
-from groups.intmodp import IntModP
-from copy import copy, deepcopy
-from itertools import product
+from math import gcd
 from random import randint
-from number_theory import euclid, extended_euclid, prime_factorise
+from number_theory import prime_factorise
+import groups.memo as memo
+from groups.memo import Memo
+from groups.order import divisor_factorisation, element_order
+from groups.polynomial import (trim, poly_add, poly_sub, poly_mul, poly_divmod,
+                               poly_powmod, poly_gcd, reduction_table, pack_rows,
+                               poly_reduce, poly_inverse, frobenius_table, poly_transform)
 
 
 class FiniteField():
     q = None
+    # largest field for which tables=True builds log/antilog tables
+    table_threshold = 2**19
 
-    def __init__(self, p, e, q=None):
+    def __new__(cls, p=None, e=None, q=None, tables=False):
+        # GF(p) needs none of the polynomial machinery
+        if cls is FiniteField and e == 1:
+            cls = PrimeField
+        return super().__new__(cls)
+
+    def __init__(self, p, e, q=None, tables=False):
         self.p = p
         self.e = e
+        self.zero = FiniteFieldElement.raw(self, (0,))
+        self.one = FiniteFieldElement.raw(self, (1,))
         if q:
-            self.q = self.elt(q)
+            self.q = FiniteFieldElement(self, q)
         else:
             self.q = self.irreducible_polynomial()
-        self.quotient = True
+        self.modulus = self.q.value
+        # x^k mod q for every k a product of two reduced elements can reach
+        self.reduction = reduction_table(self.modulus, p, 2*e - 2)
+        self.packed_reduction = pack_rows(self.reduction, p)
+        # multiplication by table lookup: log[value] = i and antilog[i] is
+        # the element g^i for a primitive g, built on first use
+        self.tables = tables and p**e <= self.table_threshold
+        self.log = None
+        self.antilog = None
+        # k: (rows, packed rows) of the linear map a -> a^(p^k)
+        self.frobenius_tables = {}
+        # Itoh-Tsujii inversion costs about 2 log(e) multiplications and
+        # beats Euclid's ~e polynomial divisions when e is small next to the
+        # size of p; measured crossover in benchmark.py inverse
+        self.itoh_tsujii = e*e <= max(4, p.bit_length() // 4)
+        self.memo = Memo()
+        self.element_orders = Memo(memo.ELEMENT_ORDER_CACHE_SIZE)
+
+    def frobenius_rows(self, k):
+        if k not in self.frobenius_tables:
+            rows = frobenius_table(self.modulus, self.p, k)
+            self.frobenius_tables[k] = rows, pack_rows(rows, self.p)
+        return self.frobenius_tables[k]
+
+    def build_tables(self):
+        n = self.order()
+        factors = self.order_factorisation()
+        for i in range(self.p, self.p**(self.e+1)):
+            # try x, x+1, ..., x^2, ... in turn until one is primitive
+            g = trim([(i // self.p**j) % self.p for j in range(self.e+1)])
+            g = poly_divmod(g, self.modulus, self.p)[1]
+            if all(poly_powmod(g, n // r, self.modulus, self.p) != (1,) for r in factors):
+                break
+        antilog = []
+        log = {}
+        value = (1,)
+        for i in range(n):
+            antilog.append(FiniteFieldElement.raw(self, value))
+            log[value] = i
+            value = poly_divmod(poly_mul(value, g, self.p), self.modulus, self.p)[1]
+        self.antilog = antilog
+        self.log = log
+        return log
 
     def elt(self, value):
         return FiniteFieldElement(self, value)
 
     def irreducible_polynomial(self):
         while True:
-            value = [IntModP(randint(1, self.p), self.p) for _ in range(self.e)]
-            random_poly = self.elt(value+[IntModP(1, self.p)])
+            value = [randint(1, self.p) for _ in range(self.e)]
+            random_poly = FiniteFieldElement(self, value+[1])
             if random_poly.is_irreducible():
                 return random_poly
 
     def order(self):
         return self.p**self.e - 1
 
+    def order_factorisation(self):
+        # prime -> exponent in the order of the multiplicative group
+        return self.memo.get('factorisation',
+                             lambda: prime_factorise(self.order(), counted=True))
+
     def __eq__(self, other):
         return (self.p == other.p and self.q == other.q and self.e == other.e)
 
@@ -39,70 +100,146 @@ class FiniteField():
 
 
 class FiniteFieldElement(FieldElement):
+    __slots__ = ('field', 'value', 'table')
 
     def __init__(self, field, value):
         self.field = field
-        self.value = []
-        self.add_id_value = [IntModP(0, field.p)]
-        self.mult_id_value = [IntModP(1, field.p)]
+        self.table = None
+        if isinstance(value, FiniteFieldElement):
+            value = value.value
         if type(value) is tuple or type(value) is list:
-            for v in value:
-                if type(v) is int:
-                    self.value.append(IntModP(v, self.field.p))
-                else:
-                    self.value.append(v)
-            while value[1:] and not self.value[1:][-1]:
-                value.pop()
-            if self.field.q and self.field.quotient:
-                self.value = divmod(self, self.field.q)[1].value
+            value = trim([v % field.p if type(v) is int else v.value for v in value])
         else:
-            self.value = [IntModP(value, self.field.p)]
+            value = (value % field.p,)
+        if field.q is not None and len(value) > field.e:
+            value = poly_divmod(value, field.modulus, field.p)[1]
+        self.value = value
+
+    @classmethod
+    def raw(cls, field, value):
+        # value is already trimmed and reduced
+        new = cls.__new__(cls)
+        new.field = field
+        new.value = value
+        new.table = None
+        return new
+
+    def reduce(self, value):
+        field = self.field
+        if len(value) > 2*field.e - 1:
+            value = poly_divmod(value, field.modulus, field.p)[1]
+        elif len(value) > field.e:
+            value = poly_reduce(value, field.reduction, field.p, field.packed_reduction)
+        return FiniteFieldElement.raw(field, value)
 
     def add(self, other):
-        l1 = len(self.value)
-        l2 = len(other.value)
-        if l1 >= l2:
-            new_value = copy(self.value)
-            for i, v in enumerate(other.value):
-                new_value[i] += v
-        else:
-            return other + self
+        return FiniteFieldElement.raw(self.field, poly_add(self.value, other.value, self.field.p))
 
-        while new_value[1:] and not new_value[1:][-1]:
-            new_value.pop()
-        return self.field.elt(new_value)
+    def __sub__(self, other):
+        return FiniteFieldElement.raw(self.field, poly_sub(self.value, other.value, self.field.p))
 
     def mult(self, other):
-        if self.is_zero() or other.is_zero():
-            return self.add_identity()
-        degree = len(self.value) + len(other.value) - 1
-        new_value = [IntModP(0, self.field.p) for _ in range(degree)]
-        for i, a in enumerate(self):
-            for j, b in enumerate(other):
-                new_value[i+j] += a*b
-        while new_value[1:] and not new_value[1:][-1]:
-            new_value.pop()
-        return self.field.elt(new_value)
+        field = self.field
+        if field.tables:
+            if self.value == (0,) or other.value == (0,):
+                return field.zero
+            log = field.log or field.build_tables()
+            return field.antilog[(log[self.value] + log[other.value]) % len(field.antilog)]
+        return self.reduce(poly_mul(self.value, other.value, field.p))
+
+    def __pow__(self, n):
+        field = self.field
+        if field.tables and self.table is None and self.value != (0,):
+            log = field.log or field.build_tables()
+            return field.antilog[log[self.value] * n % len(field.antilog)]
+        return super().__pow__(n)
+
+    def __rmul__(self, other):
+        p = self.field.p
+        return FiniteFieldElement.raw(self.field, trim([c * other % p for c in self.value]))
 
     def inverse(self):
         if self.degree() == 0:
-            new_value = self.value[0].inverse()
-            new = deepcopy(self)
-            new.value = [new_value]
-            return new
+            if not self.value[0]:
+                return self
+            return FiniteFieldElement.raw(self.field, (pow(self.value[0], -1, self.field.p),))
+        elif self.field.tables:
+            log = self.field.log or self.field.build_tables()
+            return self.field.antilog[-log[self.value] % len(self.field.antilog)]
+        elif self.field.itoh_tsujii:
+            return self.itoh_tsujii()
+        return FiniteFieldElement.raw(
+            self.field, poly_inverse(self.value, self.field.modulus, self.field.p))
 
-        a, b, c = extended_euclid(self, self.field.q)
+    def itoh_tsujii(self):
+        # with r = 1 + p + ... + p^(e-1), a^r is the norm of a and lies in
+        # GF(p), so a^-1 = a^(r-1) / a^r needs one inversion in GF(p). The
+        # powers t_m = a^(1 + p + ... + p^(m-1)) follow the addition chain
+        # t_2m = t_m^(p^m) t_m, t_m+1 = t_m^p a, and the Frobenius maps
+        # x -> x^(p^m) are linear, so each costs about one multiplication
+        t, m = self, 1
+        for bit in bin(self.field.e - 1)[3:]:
+            t = t.frobenius(m) * t
+            m *= 2
+            if bit == '1':
+                t = t.frobenius(1) * self
+                m += 1
+        b = t.frobenius(1)
+        norm = (b * self).value[0]
+        return pow(norm, -1, self.field.p) * b
 
-        return c.inverse() * a
+    def frobenius(self, k=1):
+        # self^(p^k)
+        k %= self.field.e
+        if not k or self.degree() == 0:
+            return self
+        rows, packed = self.field.frobenius_rows(k)
+        return FiniteFieldElement.raw(
+            self.field, poly_transform(self.value, rows, self.field.p, packed))
+
+    def add_identity(self):
+        return self.field.zero
+
+    def mult_identity(self):
+        return self.field.one
+
+    def is_zero(self):
+        return self.value == (0,)
+
+    def is_one(self):
+        return self.value == (1,)
+
+    def __bool__(self):
+        return self.value != (0,)
+
+    def __eq__(self, other):
+        if isinstance(other, int):
+            return self.value == (other,)
+        return self.value == other.value
+
+    def __hash__(self):
+        if len(self.value) == 1:
+            return hash(self.value[0])
+        return hash(self.value)
+
+    def encode(self):
+        # the coefficients as digits base p
+        out = 0
+        for v in reversed(self.value):
+            out = out*self.field.p + v
+        return out
 
     def is_irreducible(self):
-        x = self.field.elt((0, 1))
-        power_term = self.field.elt((0, 1))
+        # Ben-Or: no irreducible factor of degree i <= deg/2 divides self,
+        # i.e. gcd(self, x^(p^i) - x) = 1
+        p = self.field.p
+        f = self.value
+        power_term = (0, 1)
 
-        for _ in range(int(self.degree()/2)):
-            power_term = power_term ** self.field.p
-            gcd = euclid(self, power_term - x)
-            if not gcd.is_unit():
+        for _ in range(self.degree()//2):
+            power_term = poly_powmod(power_term, p, f, p)
+            gcd = poly_gcd(f, poly_sub(power_term, (0, 1), p), p)
+            if len(gcd) > 1:
                 return False
         return True
 
@@ -110,43 +247,33 @@ class FiniteFieldElement(FieldElement):
         return self.degree() == 0
 
     def __divmod__(self, divisor):
-        self.field.quotient = False
-        quotient, remainder = self.add_identity(), self
-        if divisor.degree() == 0:
-            self.field.quotient = True
-            return remainder, quotient
-
-        while remainder.degree() >= divisor.degree():
-            exp = remainder.degree() - divisor.degree()
-            new_values = [IntModP(0, self.field.p) for _ in range(exp)]
-            monomial = self.field.elt(new_values + [remainder[-1] / divisor[-1]])
-            quotient += monomial
-            remainder -= monomial * divisor
-        self.field.quotient = True
-        return quotient, remainder
+        quotient, remainder = poly_divmod(self.value, divisor.value, self.field.p)
+        return (FiniteFieldElement.raw(self.field, quotient),
+                FiniteFieldElement.raw(self.field, remainder))
 
     def add_inverse(self):
-        new = deepcopy(self)
-        new.value = [-x for x in new.value]
-        return new
+        p = self.field.p
+        return FiniteFieldElement.raw(self.field, tuple(-c % p for c in self.value))
 
     def degree(self):
         return len(self.value) - 1
 
     def order(self):
+        return self.factored_order()[0]
+
+    def factored_order(self):
+        return self.field.element_orders.get(self.value, self._factored_order)
+
+    def _factored_order(self):
+        if not self:
+            return None, None
         field_order = self.field.order()
-        fac = prime_factorise(field_order, counted=True)
-        powers = [range(e+1) for e in [fac[p] for p in sorted(fac.keys())]]
-        candidates = []
-        for p in product(*powers):
-            value = [f**p for f, p in zip(sorted(fac.keys()), p)]
-            out = 1
-            for v in value:
-                out *= v
-            candidates.append(out)
-        for c in sorted(candidates):
-            if self**c == 1:
-                return c
+        factorisation = self.field.order_factorisation()
+        if self.field.tables:
+            log = self.field.log or self.field.build_tables()
+            order = field_order // gcd(log[self.value], field_order)
+            return order, divisor_factorisation(order, factorisation)
+        return element_order(self, field_order, factorisation)
 
     def __repr__(self):
         if self.degree() == 0:
@@ -172,3 +299,129 @@ class FiniteFieldElement(FieldElement):
         return self.degree()
 
 
+class PrimeField(FiniteField):
+
+    def __init__(self, p, e=1, q=None, tables=False):
+        self.p = p
+        self.e = 1
+        self.tables = False
+        self.zero = PrimeFieldElement.raw(self, 0)
+        self.one = PrimeFieldElement.raw(self, 1)
+        self.memo = Memo()
+        self.element_orders = Memo(memo.ELEMENT_ORDER_CACHE_SIZE)
+
+    def elt(self, value):
+        return PrimeFieldElement(self, value)
+
+    def __eq__(self, other):
+        return self.p == other.p and self.e == other.e
+
+    def __repr__(self):
+        return 'GF' + str(self.p)
+
+
+class PrimeFieldElement(FieldElement):
+    # an element of GF(p) backed by a single int; value is the one-term
+    # polynomial (n,) so it can stand in for a FiniteFieldElement
+    __slots__ = ('field', 'n', 'table')
+
+    def __init__(self, field, value):
+        self.field = field
+        self.table = None
+        if type(value) is tuple or type(value) is list:
+            value = trim([v if type(v) is int else v.value for v in value])
+            if len(value) > 1:
+                raise ValueError('Not an element of ' + str(field), value)
+            value = value[0]
+        elif type(value) is not int:
+            value = value.value
+            value = value[0] if type(value) is tuple else value
+        self.n = value % field.p
+
+    @classmethod
+    def raw(cls, field, n):
+        new = cls.__new__(cls)
+        new.field = field
+        new.n = n
+        new.table = None
+        return new
+
+    @property
+    def value(self):
+        return (self.n,)
+
+    def add(self, other):
+        return PrimeFieldElement.raw(self.field, (self.n + other.n) % self.field.p)
+
+    def __sub__(self, other):
+        return PrimeFieldElement.raw(self.field, (self.n - other.n) % self.field.p)
+
+    def mult(self, other):
+        return PrimeFieldElement.raw(self.field, self.n * other.n % self.field.p)
+
+    def __rmul__(self, other):
+        return PrimeFieldElement.raw(self.field, self.n * other % self.field.p)
+
+    def __pow__(self, n):
+        if self.table is not None or (n < 0 and not self.n):
+            return super().__pow__(n)
+        return PrimeFieldElement.raw(self.field, pow(self.n, n, self.field.p))
+
+    def inverse(self):
+        if not self.n:
+            return self
+        return PrimeFieldElement.raw(self.field, pow(self.n, -1, self.field.p))
+
+    def add_inverse(self):
+        return PrimeFieldElement.raw(self.field, -self.n % self.field.p)
+
+    def add_identity(self):
+        return self.field.zero
+
+    def mult_identity(self):
+        return self.field.one
+
+    def is_zero(self):
+        return not self.n
+
+    def is_one(self):
+        return self.n == 1
+
+    def is_unit(self):
+        return True
+
+    def __bool__(self):
+        return self.n != 0
+
+    def __eq__(self, other):
+        if isinstance(other, int):
+            return self.n == other
+        return self.n == other.n
+
+    def __hash__(self):
+        return hash(self.n)
+
+    def encode(self):
+        return self.n
+
+    def __int__(self):
+        return self.n
+
+    def frobenius(self, k=1):
+        return self
+
+    def __mod__(self, q):
+        return self.n % q
+
+    def degree(self):
+        return 0
+
+    def __abs__(self):
+        return 0
+
+    order = FiniteFieldElement.order
+    factored_order = FiniteFieldElement.factored_order
+    _factored_order = FiniteFieldElement._factored_order
+
+    def __repr__(self):
+        return str(self.n)
@@ -1,17 +1,25 @@
 from copy import deepcopy
+from groups.exponentiation import FixedBaseTable, power
+from number_theory import prime_factorise
 
 
 class GroupElement():
+    __slots__ = ()
 
     value = None
     id_value = None
     order = None
+    # inverses cost about as much as a group operation (e.g. negating a
+    # point), so exponentiation can use signed digits
+    cheap_inverse = False
+    # fixed-base table built by precompute()
+    table = None
 
     def __init__(self, value):
         self.value = value
 
     def identity(self):
-        new = deepcopy(self)
+        new = deepcopy(self, {id(self.table): None})
         new.value = new.id_value
         return new
 
@@ -33,22 +41,25 @@ class GroupElement():
         return self.inverse()
 
     def __pow__(self, n):
-        if n < 0:
-            return self.inverse()**-n
-        elif n == 0:
-            return self.identity()
-        elif n == 1:
-            return self
-        elif n % 2:
-            return self * (self*self)**((n-1)//2)
-        else:
-            return (self*self)**(n//2)
+        return power(self, n)
+
+    def factored_order(self):
+        # the order and its factorisation as prime -> exponent
+        n = self.order()
+        return n, dict(prime_factorise(n, counted=True))
+
+    def encode(self):
+        # a canonical key for the element in hash tables; subclasses give an
+        # int, which is smaller to store than the element
+        return self.value
+
+    def precompute(self, max_bits, max_size=None):
+        self.table = FixedBaseTable(self, max_bits, max_size)
+        return self
 
     def __rmul__(self, other):
-        out = self.identity()
-        for i in range(other):
-            out += self
-        return out
+        # k*x is the k-fold group operation, so x^k
+        return power(self, other)
 
     def __repr__(self):
         return str(self.value)
@@ -1,8 +1,8 @@
 from groups.fieldelement import FieldElement
-import number_theory as nt
 
 
 class IntModP(FieldElement):
+    __slots__ = ('value', 'p', 'table')
     id_value = 1
     mult_id_value = 1
     add_id_value = 0
@@ -10,6 +10,7 @@ class IntModP(FieldElement):
     def __init__(self, value, p):
         self.value = value % p
         self.p = p
+        self.table = None
 
     def mult(self, other):
         if self.p != other.p:
@@ -25,22 +26,37 @@ class IntModP(FieldElement):
         new_value = (self.value + other.value) % self.p
         return IntModP(new_value, self.p)
 
+    def __rmul__(self, other):
+        return IntModP(self.value * other, self.p)
+
     def mult_inverse(self):
-        return IntModP(nt.mod_mult_inv(self.value, self.p), self.p)
+        if not self.value:
+            return self
+        return IntModP(pow(self.value, -1, self.p), self.p)
 
     def add_inverse(self):
-        return IntModP((-self.value) % self.p, self.p)
+        return IntModP(-self.value, self.p)
+
+    def add_identity(self):
+        return IntModP(0, self.p)
+
+    def mult_identity(self):
+        return IntModP(1, self.p)
 
     def order(self):
         return self.p - 1
 
     def __eq__(self, other):
-        if other == 0:
-            return self.add_id_value == self.value
-        elif other == 1:
-            return self.id_value == self.value
+        if isinstance(other, int):
+            return self.value == other
         else:
             return self.value == other.value and self.p == other.p
 
+    def __hash__(self):
+        return hash(self.value)
+
+    def encode(self):
+        return self.value
+
     def __mod__(self, q):
         return self.value % q
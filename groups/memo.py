@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+
+# element orders remembered per group, for groups created after it is set;
+# 0 turns the cache off
+ELEMENT_ORDER_CACHE_SIZE = 1024
+
+
+class Memo():
+    # values computed once per key, least recently used first out when
+    # maxsize is set, counting hits and misses
+
+    def __init__(self, maxsize=None):
+        self.values = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        if key in self.values:
+            self.hits += 1
+            self.values.move_to_end(key)
+            return self.values[key]
+        self.misses += 1
+        value = compute()
+        if self.maxsize != 0:
+            self.values[key] = value
+            if self.maxsize is not None and len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.values.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.values)}
+
+
+def cache_stats(group):
+    # hit and miss counts for a curve or field
+    return {'group': group.memo.stats(), 'element orders': group.element_orders.stats()}
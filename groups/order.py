@@ -0,0 +1,60 @@
+def element_order(x, n, factorisation, tree=True):
+    # order of x, given x^n = 1 and the factorisation of n as prime ->
+    # exponent, by stripping primes from n; returns the order and its
+    # factorisation. With tree, the q-parts of x for every prime q come from
+    # a product tree: x to the product of the other half of the prime powers
+    # takes each half of the primes, so the exponents at each level of the
+    # tree add up to about log n bits, instead of log n per prime
+    primes = sorted(factorisation)
+    out = {}
+    if tree:
+        strip_tree(x, primes, factorisation, out)
+    else:
+        for q in primes:
+            k = factorisation[q]
+            y = x**(n // q**k)
+            strip(y, q, k, out)
+    order = 1
+    for q, k in out.items():
+        order *= q**k
+    return order, out
+
+
+def strip_tree(x, primes, factorisation, out):
+    # x^(product of q^k over primes) = 1
+    if not primes:
+        return
+    if len(primes) == 1:
+        strip(x, primes[0], factorisation[primes[0]], out)
+        return
+    left, right = primes[:len(primes)//2], primes[len(primes)//2:]
+    for keep, kill in [(left, right), (right, left)]:
+        exponent = 1
+        for q in kill:
+            exponent *= q**factorisation[q]
+        strip_tree(x**exponent, keep, factorisation, out)
+
+
+def strip(y, q, k, out):
+    # y has order q^j for some j <= k
+    j = 0
+    while not y == 1:
+        if j == k:
+            raise ValueError('Element order does not divide the given order')
+        y = y**q
+        j += 1
+    if j:
+        out[q] = j
+
+
+def divisor_factorisation(d, factorisation):
+    # prime -> exponent for d, a divisor of a number factorised as given
+    out = {}
+    for q in factorisation:
+        j = 0
+        while d % q == 0:
+            d //= q
+            j += 1
+        if j:
+            out[q] = j
+    return out
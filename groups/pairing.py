@@ -0,0 +1,306 @@
+from math import gcd
+from groups.fieldelement import batch_inverse
+
+
+def miller_lines(P, n):
+    # the steps of the Miller loop for f_{n,P}, with divisor n(P) - ([n]P) -
+    # (n-1)(O), in one pass over the bits of n: (square, line, vertical) with
+    # line (A, B, C) for Ay + Bx + C and vertical (D, E) for Dx + E, either
+    # None for 1, and f_{n,P} = product of lines / product of verticals, each
+    # product squared at the steps marked square. T = [k]P stays in Jacobian
+    # coordinates and each line is scaled by the powers of Z in T's
+    # coordinates, the scale going in with the vertical through the new T,
+    # so there are no inversions. Every bit of n gives the same steps
+    # whatever P is, so the loops for several points can run side by side
+    a = P.curve.curve[0]
+    zero = P.curve.field.zero
+    one = P.curve.field.one
+    x_P, y_P = P.value
+    X, Y, Z = x_P, y_P, one
+    identity = False
+    for bit in bin(n)[3:]:
+        if identity:
+            yield True, None, None
+        elif not Y:
+            # T has order 2: the tangent is vertical and 2T = O
+            ZZ = Z*Z
+            yield True, (zero, ZZ, -X), (zero, ZZ)
+            identity = True
+        else:
+            ZZ = Z*Z
+            XX = X*X
+            YY = Y*Y
+            M = XX + XX + XX
+            if a:
+                M = M + a*ZZ*ZZ
+            S = X*YY
+            S = S + S
+            S = S + S
+            X_3 = M*M - (S + S)
+            YYYY = YY*YY
+            YYYY = YYYY + YYYY
+            YYYY = YYYY + YYYY
+            Y_3 = M*(S - X_3) - (YYYY + YYYY)
+            Z_3 = Y*Z
+            Z_3 = Z_3 + Z_3
+            # the tangent times 2YZ^3 = Z_3 Z^2, and the vertical through
+            # [2]T times Z_3^2, so the line goes in times Z_3 and the
+            # vertical times Z^2
+            A = Z_3*ZZ
+            B = M*ZZ
+            yield True, (A*Z_3, -B*Z_3, (M*X - (YY + YY))*Z_3), (ZZ*Z_3*Z_3, -ZZ*X_3)
+            X, Y, Z = X_3, Y_3, Z_3
+        if bit == '0':
+            continue
+        if identity:
+            # O + P = P, and the line through them is the vertical at P
+            X, Y, Z = x_P, y_P, one
+            identity = False
+            yield False, None, None
+            continue
+        ZZ = Z*Z
+        H = x_P*ZZ - X
+        R = y_P*ZZ*Z - Y
+        if not H:
+            if R:
+                # T = -P: the chord is vertical and T + P = O
+                identity = True
+                yield False, (zero, one, -x_P), None
+                continue
+            raise ValueError('Miller loop passed through P twice')
+        Z_3 = Z*H
+        HH = H*H
+        HHH = H*HH
+        V = X*HH
+        X_3 = R*R - HHH - (V + V)
+        Y_3 = R*(V - X_3) - Y*HHH
+        # the chord through T and P times Z_3, going in times Z_3, and the
+        # vertical through T + P times Z_3^2
+        ZZ_3 = Z_3*Z_3
+        RZ_3 = R*Z_3
+        yield False, (ZZ_3, -RZ_3, RZ_3*x_P - ZZ_3*y_P), (ZZ_3, -X_3)
+        X, Y, Z = X_3, Y_3, Z_3
+
+
+def line_value(line, x, y):
+    # Ay + Bx + C, with A = None for 1
+    A, B, C = line
+    value = B*x + C
+    if A is None:
+        return value + y
+    return value + A*y if A else value
+
+
+def vertical_value(vertical, x):
+    # Dx + E, with D = None for 1
+    D, E = vertical
+    return x + E if D is None else D*x + E
+
+
+def miller_product(loops, one):
+    # the product of the Miller functions f_i(x_i, y_i) as (numerator,
+    # denominator), for loops of (steps, x, y, verticals) whose steps all
+    # come from the same n, sharing the squarings; without verticals a
+    # loop's verticals are left out, which is right when they lie in a
+    # subfield the final exponentiation kills
+    num, den = one, one
+    for steps in zip(*[loop[0] for loop in loops]):
+        if steps[0][0]:
+            num = num*num
+            den = den*den
+        for (_, line, vertical), (_, x, y, verticals) in zip(steps, loops):
+            if line is not None:
+                num = num * line_value(line, x, y)
+            if verticals and vertical is not None:
+                den = den * vertical_value(vertical, x)
+    return num, den
+
+
+def miller_loop(P, n, x, y, verticals=True):
+    # f_{n,P}(x, y) as (numerator, denominator)
+    return miller_product([(miller_lines(P, n), x, y, verticals)], P.curve.field.one)
+
+
+class PreparedPoint():
+    # the Miller loop of f_{n,P} for a fixed P, run once: the lines are kept
+    # scaled to leading coefficient 1, with one batched inversion, and the
+    # scales multiplied out into one constant, so f_{n,P} at a further point
+    # only evaluates the stored lines. Stands in for P as the first argument
+    # of tate_pairing and tate_product, with n the order, or for Q as the
+    # second of ate_pairing, with n the ate loop
+
+    def __init__(self, P, n=None):
+        self.P = P
+        self.n = n or P.order()
+        zero, one = P.curve.field.zero, P.curve.field.one
+        steps = list(miller_lines(P, self.n))
+        leading = []
+        for _, line, vertical in steps:
+            if line is not None:
+                leading.append(line[0] or line[1])
+            if vertical is not None:
+                leading.append(vertical[0] or vertical[1])
+        inverses = iter(batch_inverse(leading))
+        self.steps = []
+        # the scales, squared along with the lines
+        scale_num, scale_den = one, one
+        for square, line, vertical in steps:
+            if square:
+                scale_num = scale_num*scale_num
+                scale_den = scale_den*scale_den
+            if line is not None:
+                A, B, C = line
+                inv = next(inverses)
+                scale_num = scale_num * (A or B)
+                line = (None, B*inv, C*inv) if A else (zero, one, C*inv)
+            if vertical is not None:
+                D, E = vertical
+                inv = next(inverses)
+                scale_den = scale_den * (D or E)
+                vertical = (None, E*inv) if D else None
+            self.steps.append((square, line, vertical))
+        self.scale = (scale_num, scale_den)
+
+
+def final_exponentiation(num, den, r):
+    # (num/den)^((q - 1)/r) over a field of q elements. For an even degree
+    # 2h with r | p^h + 1, the p^h - 1 part is a Frobenius and a division,
+    # leaving an exponent of half the size
+    field = num.field
+    p, e = field.p, field.e
+    if e % 2 == 0 and (p**(e//2) + 1) % r == 0:
+        h = e // 2
+        f = num.frobenius(h) * den * (den.frobenius(h) * num).inverse()
+        return f**((p**h + 1) // r)
+    return (num * den.inverse())**((p**e - 1) // r)
+
+
+def subfield_verticals(P, x, r):
+    # True when the vertical lines and the Z scales of f_{r,P}(x, y) all
+    # lie in GF(p^h) for a field GF(p^2h), which the final exponentiation
+    # kills when r | p^h + 1
+    field = P.curve.field
+    if field.e % 2 or P.is_identity():
+        return False
+    h = field.e // 2
+    if gcd(r, field.p**h - 1) != 1:
+        return False
+    return all(c.frobenius(h) == c for c in P.value + (x,))
+
+
+def check_embedding(field, r):
+    if (field.p**field.e - 1) % r:
+        raise ValueError('The field holds no r-th roots of unity', r)
+
+
+def tate_pairing(P, Q, r=None):
+    # the reduced Tate pairing f_{r,P}(Q)^((q - 1)/r) for P of order r | q - 1,
+    # or a PreparedPoint, and any point Q, over a field of q elements. Q
+    # must not be a zero or pole of f_{r,P}, so not in <P>. Denominators are
+    # left out when the curve is over GF(p^2h) and P and Q's x lie in
+    # GF(p^h), as for the distortion maps of supersingular curves
+    return tate_product([(P, Q)], r)
+
+
+def tate_product(pairs, r=None):
+    # t(P_1, Q_1) t(P_2, Q_2) ... for P_i of the same order r, as points or
+    # PreparedPoints, with the Miller loops run side by side so that they
+    # share the squarings and one final exponentiation
+    P = pairs[0][0]
+    if r is None:
+        r = P.n if isinstance(P, PreparedPoint) else P.order()
+    field = (P.P if isinstance(P, PreparedPoint) else P).curve.field
+    check_embedding(field, r)
+    loops = []
+    scale_num, scale_den = field.one, field.one
+    for P, Q in pairs:
+        prepared = isinstance(P, PreparedPoint)
+        if prepared and P.n != r:
+            raise ValueError('PreparedPoint made for another order', P.n)
+        point = P.P if prepared else P
+        if point.is_identity() or Q.is_identity():
+            continue
+        x, y = Q.value
+        verticals = not subfield_verticals(point, x, r)
+        if not prepared:
+            loops.append((miller_lines(P, r), x, y, verticals))
+            continue
+        loops.append((P.steps, x, y, verticals))
+        if verticals:
+            scale_num = scale_num * P.scale[0]
+            scale_den = scale_den * P.scale[1]
+    if not loops:
+        return field.one
+    num, den = miller_product(loops, field.one)
+    num, den = num * scale_num, den * scale_den
+    if not num or not den:
+        raise ValueError('Q is a zero or pole of the Miller function of P')
+    return final_exponentiation(num, den, r)
+
+
+def weil_pairing(P, Q, r=None):
+    # e_r(P, Q) = (-1)^r f_{r,P}(Q) / f_{r,Q}(P) for P and Q of order r,
+    # with two Miller loops and no auxiliary point; 1 when Q is in <P>
+    r = r or P.order()
+    field = P.curve.field
+    if P.is_identity() or Q.is_identity() or P == Q:
+        return field.one
+    num_P, den_P = miller_loop(P, r, *Q.value)
+    num_Q, den_Q = miller_loop(Q, r, *P.value)
+    if not num_P or not den_P or not num_Q or not den_Q:
+        # only points of <P> meet the lines of f_{r,P}
+        return field.one
+    out = num_P * den_Q * (den_P * num_Q).inverse()
+    return -out if r % 2 else out
+
+
+def ate_loop(curve, r):
+    # the shortest s = p^i (mod r) for 0 < i < k, the embedding degree,
+    # with the pairing f_{s,Q}(P)^((q - 1)/r) non-degenerate, which holds
+    # when r does not divide (s^k - 1)/r; t - 1 = p (mod r) is tried too
+    # when r divides #E(GF(p)) = p + 1 - t
+    field = curve.field
+    p = field.p
+    k = next(d for d in range(1, field.e + 1) if field.e % d == 0 and pow(p, d, r) == 1)
+    candidates = {pow(p, i, r) for i in range(1, k)}
+    t = curve.trace()
+    if (p + 1 - t) % r == 0:
+        candidates.add((t - 1) % r)
+    for s in sorted(candidates):
+        if s > 1 and (s**k - 1) // r % r:
+            return s
+    raise ValueError('No ate pairing for embedding degree', k)
+
+
+def ate_pairing(P, Q, r=None, s=None):
+    # the ate pairing f_{s,Q}(P)^((q - 1)/r) for P of order r in E(GF(p))
+    # and Q in the r-torsion where the Frobenius acts as p, or a
+    # PreparedPoint for Q with n = s, on a curve with coefficients in GF(p);
+    # s from ate_loop, often much shorter than r. Denominators are kept, as
+    # Q's lines are not in a subfield
+    curve = P.curve
+    if any(c.degree() > 0 for c in curve.curve):
+        raise ValueError('The ate pairing needs a curve defined over GF(p)')
+    r = r or P.order()
+    check_embedding(curve.field, r)
+    prepared = isinstance(Q, PreparedPoint)
+    if P.is_identity() or (Q.P if prepared else Q).is_identity():
+        return curve.field.one
+    if prepared:
+        num, den = miller_product([(Q.steps, *P.value, True)], curve.field.one)
+        num, den = num * Q.scale[0], den * Q.scale[1]
+    else:
+        num, den = miller_loop(Q, s or ate_loop(curve, r), *P.value)
+    if not num or not den:
+        raise ValueError('P is a zero or pole of the Miller function of Q')
+    return final_exponentiation(num, den, r)
+
+
+def trace_zero(Q):
+    # e Q - (Q + pi Q + ... + pi^(e-1) Q) for a curve over GF(p) viewed over
+    # GF(p^e): the part of Q on which the Frobenius acts as p, for ate_pairing
+    e = Q.curve.field.e
+    trace = Q
+    for i in range(1, e):
+        trace = trace + Q.frobenius(i)
+    return Q**e - trace
@@ -0,0 +1,394 @@
+from math import isqrt
+from random import randint
+from groups.ecpoint import ECPoint
+from groups.polynomial import (kronecker, pack, poly_divmod, poly_gcd, poly_mul, poly_powmod,
+                               poly_reduce, poly_sub, reduction_table, schoolbook, trim, unpack)
+from number_theory import chinese_remainder_theorem, eratosthenes, legendre_symbol, modular_sqrt
+
+
+# below this p, count the points one x at a time
+NAIVE_BOUND = 2**10
+# baby-step giant-step is left at most this many candidates for the trace,
+# which bounds the size of its table
+BSGS_BOUND = 2**36
+# random points to try before moving to the quadratic twist
+BSGS_ATTEMPTS = 10
+
+
+def naive_trace(a, b, p):
+    # #E = p + 1 + sum over x of the Legendre symbol of x^3 + ax + b
+    return -sum(legendre_symbol(x**3 + a*x + b, p) for x in range(p))
+
+
+def series_inverse(a, n, p):
+    # a^-1 mod x^n by Newton iteration, doubling the precision each step
+    g = [pow(a[0], -1, p)]
+    k = 1
+    while k < n:
+        k = min(2*k, n)
+        e = [-c % p for c in kronecker(list(a[:k]), g, p)[:k]]
+        e[0] = (e[0] + 2) % p
+        g = [c % p for c in kronecker(g, e, p)[:k]]
+    return g[:n]
+
+
+class QuotientRing():
+    # GF(p)[x]/(h) for h of large degree d, elements as lists of exactly d
+    # coefficients. Products are Kronecker products reduced with Barrett's
+    # method: the quotient by h comes from the inverse of the reversed h as
+    # a power series, so a reduction is two more big int products
+
+    def __init__(self, modulus, p):
+        lead_inv = pow(modulus[-1], -1, p)
+        modulus = tuple(c * lead_inv % p for c in modulus)
+        self.p = p
+        self.d = len(modulus) - 1
+        self.modulus = modulus
+        self.low = list(modulus[:-1])
+        self.inverse = series_inverse(modulus[::-1], self.d - 1, p)
+        # x^d, ..., x^(d+2) mod h, for products with a cubic
+        self.rows = reduction_table(modulus, p, self.d + 2)
+        self.one = self.element((1,))
+
+    def element(self, a):
+        return [c % self.p for c in a] + [0] * (self.d - len(a))
+
+    def reduce(self, c):
+        d, p = self.d, self.p
+        if len(c) <= d:
+            return c + [0] * (d - len(c))
+        # reversed quotient = (top of c, reversed) * inverse mod x^m
+        m = len(c) - d
+        q = [x % p for x in kronecker(c[:d-1:-1], self.inverse[:m], p)[:m]]
+        q.reverse()
+        # h is monic, so c - q*h agrees with c - q*(h - x^d) below x^d
+        qh = kronecker(q, self.low, p)
+        return [(x - y) % p for x, y in zip(c[:d], qh + [0] * (d - len(qh)))]
+
+    def add(self, u, v):
+        return [(x + y) % self.p for x, y in zip(u, v)]
+
+    def sub(self, u, v):
+        return [(x - y) % self.p for x, y in zip(u, v)]
+
+    def scale(self, u, c):
+        return [x * c % self.p for x in u]
+
+    def mul(self, u, v):
+        return self.reduce([c % self.p for c in kronecker(u, v, self.p)])
+
+    def mul_small(self, u, g):
+        # u * g for g of degree at most 3
+        out = poly_reduce([c % self.p for c in schoolbook(u, g)], self.rows, self.p)
+        return self.element(out)
+
+    def power(self, g, n):
+        # g^n for g of degree at most 3, so the multiplications are cheap
+        out = self.one
+        for bit in bin(n)[2:]:
+            out = self.mul(out, out)
+            if bit == '1':
+                out = self.mul_small(out, g)
+        return out
+
+    def compose(self, polys, a):
+        # g(a) for each g in polys, by baby steps a^i for i < k and Horner's
+        # rule in a^k (Brent-Kung), so about 2 sqrt(d) products per g
+        d, p = self.d, self.p
+        k = isqrt(d - 1) + 1
+        powers = [self.one, a]
+        for _ in range(k - 1):
+            powers.append(self.mul(powers[-1], a))
+        giant = powers.pop()
+        w = (2 * (p-1).bit_length() + k.bit_length() + 7) // 8
+        packed = [pack(u, w) for u in powers]
+
+        out = []
+        for g in polys:
+            total = None
+            for j in range((d - 1) // k * k, -1, -k):
+                block = sum(c * x for c, x in zip(g[j:j+k], packed) if c)
+                block = [c % p for c in unpack(block, d, w)]
+                total = block if total is None else self.add(self.mul(total, giant), block)
+            out.append(total)
+        return out
+
+
+class DivisionPolynomials():
+    # psi_n for odd n and psi_n / y for even n, as polynomials in x, for
+    # y^2 = x^3 + ax + b over GF(p)
+
+    def __init__(self, a, b, p):
+        self.p = p
+        self.f_2 = poly_mul((b % p, a % p, 0, 1), (b % p, a % p, 0, 1), p)
+        self.cache = {
+            0: (0,),
+            1: (1,),
+            2: (2,),
+            3: trim([c % p for c in (-a*a, 12*b, 6*a, 0, 3)]),
+            4: trim([4*c % p for c in (-a**3 - 8*b*b, -4*a*b, -5*a*a, 20*b, 5*a, 0, 1)]),
+        }
+
+    def __getitem__(self, n):
+        if n not in self.cache:
+            p = self.p
+            m = n // 2
+            if n % 2:
+                u = poly_mul(self[m+2], self.cube(self[m]), p)
+                v = poly_mul(self[m-1], self.cube(self[m+1]), p)
+                # the even ones carry a factor y, and y^4 = f^2
+                if m % 2:
+                    v = poly_mul(v, self.f_2, p)
+                else:
+                    u = poly_mul(u, self.f_2, p)
+                self.cache[n] = poly_sub(u, v, p)
+            else:
+                u = poly_mul(self[m+2], self.square(self[m-1]), p)
+                v = poly_mul(self[m-2], self.square(self[m+1]), p)
+                g = poly_mul(self[m], poly_sub(u, v, p), p)
+                half = pow(2, -1, p)
+                self.cache[n] = trim([c * half % p for c in g])
+        return self.cache[n]
+
+    def square(self, g):
+        return poly_mul(g, g, self.p)
+
+    def cube(self, g):
+        return poly_mul(g, self.square(g), self.p)
+
+
+class TorsionPoints():
+    # points of E(GF(p)[x, y]/(h(x), y^2 - f(x))) in Jacobian coordinates
+    # (X, Y, Z) ~ (X/Z^2, y Y/Z^3), with the factor y left implicit
+
+    def __init__(self, ring, a, b):
+        self.ring = ring
+        self.a = a % ring.p
+        self.f = (b % ring.p, self.a, 0, 1)
+
+    def add(self, P, Q):
+        R = self.ring
+        X_1, Y_1, Z_1 = P
+        X_2, Y_2, Z_2 = Q
+        Z_1Z_1 = R.mul(Z_1, Z_1)
+        U_2 = R.mul(X_2, Z_1Z_1)
+        S_2 = R.mul(Y_2, R.mul(Z_1, Z_1Z_1))
+        if Z_2 is R.one:
+            U_1, S_1 = X_1, Y_1
+        else:
+            Z_2Z_2 = R.mul(Z_2, Z_2)
+            U_1 = R.mul(X_1, Z_2Z_2)
+            S_1 = R.mul(Y_1, R.mul(Z_2, Z_2Z_2))
+        H = R.sub(U_2, U_1)
+        r = R.sub(S_2, S_1)
+        HH = R.mul(H, H)
+        HHH = R.mul(H, HH)
+        V = R.mul(U_1, HH)
+        # r carries a factor y, so r^2 picks up f
+        X_3 = R.sub(R.sub(R.mul_small(R.mul(r, r), self.f), HHH), R.add(V, V))
+        Y_3 = R.sub(R.mul(r, R.sub(V, X_3)), R.mul(S_1, HHH))
+        Z_3 = R.mul(Z_1, H) if Z_2 is R.one else R.mul(R.mul(Z_1, Z_2), H)
+        return X_3, Y_3, Z_3
+
+    def double(self, P):
+        # the usual Z_3 = 2 y Y Z has a factor y, so scale the point by y,
+        # which multiplies X, Y and Z each by y^2 = f
+        R = self.ring
+        X, Y, Z = P
+        XX = R.mul(X, X)
+        YY = R.mul_small(R.mul(Y, Y), self.f)
+        ZZ = R.mul(Z, Z)
+        S = R.scale(R.mul(X, YY), 4)
+        M = R.add(R.scale(XX, 3), R.scale(R.mul(ZZ, ZZ), self.a))
+        X_3 = R.sub(R.mul(M, M), R.add(S, S))
+        Y_3 = R.sub(R.mul(M, R.sub(S, X_3)), R.scale(R.mul(YY, YY), 8))
+        Z_3 = R.scale(R.mul(Y, Z), 2)
+        return R.mul_small(X_3, self.f), R.mul_small(Y_3, self.f), R.mul_small(Z_3, self.f)
+
+    def multiply(self, P, n):
+        # n must be less than l, so no intermediate sum is degenerate
+        out = P
+        for bit in bin(n)[3:]:
+            out = self.double(out)
+            if bit == '1':
+                out = self.add(out, P)
+        return out
+
+
+def trace_mod_2(a, b, p):
+    # t is even iff E has a point of order 2, i.e. f has a root in GF(p)
+    f = (b % p, a % p, 0, 1)
+    x_p = poly_powmod((0, 1), p, f, p)
+    return 0 if len(poly_gcd(f, poly_sub(x_p, (0, 1), p), p)) > 1 else 1
+
+
+def trace_mod_l(l, a, b, p, psi):
+    # Schoof: find t mod l from pi^2 - t pi + p = 0 on the l-torsion, where
+    # pi is the Frobenius (x, y) -> (x^p, y^p)
+    h = psi[l]
+    R = QuotientRing(h, p)
+    E = TorsionPoints(R, a, b)
+    x = R.element((0, 1))
+    x_p = R.power((0, 1), p)
+    y_p = R.power(E.f, (p - 1) // 2)
+    # (p^2 - 1)/2 = (p - 1)/2 * (p + 1), and g^p = g(x^p)
+    x_p2, y_p2 = R.compose([x_p, y_p], x_p)
+    y_p2 = R.mul(y_p2, y_p)
+
+    q = p % l
+    P = (x, R.one, R.one)
+    Q = E.multiply(P, q)
+    X_Q, Y_Q, Z_Q = Q
+    ZZ = R.mul(Z_Q, Z_Q)
+    H = R.sub(X_Q, R.mul(x_p2, ZZ))
+
+    if len(poly_gcd(h, trim(H), p)) == 1:
+        # pi^2 P != +-qP for every P, so t != 0 and pi^2 P + qP = t pi P
+        S = E.add(Q, (x_p2, y_p2, R.one))
+        X_S, Y_S, Z_S = S
+        ZZ_S = R.mul(Z_S, Z_S)
+        ZZZ_S = R.mul(ZZ_S, Z_S)
+        pi = (x_p, y_p, R.one)
+        T = pi
+        for tau in range(1, (l + 1) // 2):
+            if tau == 2:
+                T = E.double(pi)
+            elif tau > 2:
+                T = E.add(T, pi)
+            X_T, Y_T, Z_T = T
+            ZZ_T = R.mul(Z_T, Z_T)
+            if R.mul(X_S, ZZ_T) == R.mul(X_T, ZZ_S):
+                if R.mul(Y_S, R.mul(Z_T, ZZ_T)) == R.mul(Y_T, ZZZ_S):
+                    return tau
+                return l - tau
+        raise ArithmeticError('No trace found modulo {}'.format(l))
+
+    # pi^2 P = +-qP for some P. With pi^2 P = -qP, t = 0; otherwise pi has
+    # an eigenvalue w with w^2 = q, and t = 2w
+    if legendre_symbol(q, l) != 1:
+        return 0
+    w = modular_sqrt(q, l) % l
+    X_W, Y_W, Z_W = E.multiply(P, w)
+    ZZ_W = R.mul(Z_W, Z_W)
+    g = poly_gcd(h, trim(R.sub(R.mul(x_p, ZZ_W), X_W)), p)
+    if len(g) == 1:
+        return 0
+    # on the points where pi P = +-wP, compare y-coordinates for the sign
+    difference = trim(R.sub(R.mul(y_p, R.mul(Z_W, ZZ_W)), Y_W))
+    if poly_divmod(difference, g, p)[1] == (0,):
+        return 2 * w % l
+    return -2 * w % l
+
+
+def schoof_cost(l, p):
+    # rough time to find t mod l, in units of baby or giant steps, fitted to
+    # measurements of trace_mod_l for 89 to 160 bit p
+    return l**3.2 * p.bit_length()**1.9 / 1700
+
+
+def schoof(a, b, p, abort=None):
+    # t modulo a product M of small primes, stopping once baby-step
+    # giant-step over the remaining candidates is cheaper than another prime,
+    # or with None as soon as abort(t mod l, l) is true
+    width = 2 * isqrt(4 * p) + 1
+    t, M = 0, 1
+    psi = DivisionPolynomials(a, b, p)
+    for l in eratosthenes(1000):
+        steps = 2 * isqrt(width // M + 1)
+        if width <= BSGS_BOUND * M and steps * (1 - l**-0.5) < schoof_cost(l, p):
+            break
+        elif l == p:
+            continue
+        t_l = trace_mod_2(a, b, p) if l == 2 else trace_mod_l(l, a, b, p, psi)
+        if abort is not None and abort(t_l, l):
+            return None
+        t, M = chinese_remainder_theorem([(t, M), (t_l, l)])
+    return t, M
+
+
+def random_point(curve):
+    a, b = curve.curve[0].value[0], curve.curve[1].value[0]
+    p = curve.field.p
+    while True:
+        x = randint(0, p - 1)
+        y_squared = (x**3 + a*x + b) % p
+        if legendre_symbol(y_squared, p) == 1:
+            return curve.point(x, modular_sqrt(y_squared, p))
+
+
+def annihilators(P, start, step, count):
+    # the k < count with [start + k step]P = O, by baby-step giant-step;
+    # None if [step]P has too small an order to tell them apart
+    m = isqrt(count - 1) + 1
+    G = P**step
+    babies = [P.identity()]
+    for _ in range(m):
+        babies.append(babies[-1] + G)
+    ECPoint.batch_normalize(babies)
+    table = {}
+    for j, B in enumerate(babies[:m]):
+        if B.value in table:
+            return None
+        table[B.value] = j
+
+    # -[start]P - [i m step]P = [j step]P
+    Y = -(P**start)
+    giant = -babies[m]
+    out = set()
+    for i in range(0, count, m):
+        j = table.get(Y.value)
+        if j is not None and i + j < count:
+            out.add(i + j)
+        Y = Y + giant
+    return out
+
+
+def quadratic_twist(curve):
+    # y^2 = x^3 + an^2 x + bn^3 for a non-residue n, which has order p + 1 + t
+    a, b = curve.curve[0].value[0], curve.curve[1].value[0]
+    p = curve.field.p
+    n = randint(1, p - 1)
+    while legendre_symbol(n, p) != -1:
+        n = randint(1, p - 1)
+    return type(curve)((a*n*n, b*n**3), curve.field)
+
+
+def bsgs_trace(curve, t, M):
+    # the t' = t (mod M) in the Hasse interval with [p + 1 - t']P = O for
+    # random points P. If every point has too small an order to single it
+    # out, points on the quadratic twist, of order p + 1 + t', can
+    p = curve.field.p
+    bound = isqrt(4 * p)
+    low = -bound + (t + bound) % M
+    count = (bound - low) // M + 1
+    if count == 1:
+        return low
+    candidates = None
+    for sign in (1, -1):
+        E = curve if sign == 1 else quadratic_twist(curve)
+        for _ in range(BSGS_ATTEMPTS):
+            matches = annihilators(random_point(E), p + 1 - sign * low, -sign * M, count)
+            if matches is not None:
+                candidates = matches if candidates is None else candidates & matches
+            if candidates is not None and len(candidates) == 1:
+                return low + candidates.pop() * M
+    raise ArithmeticError('Could not determine the order of ' + str(curve))
+
+
+def frobenius_trace(curve):
+    # t = p + 1 - #E(GF(p)) for a curve over a prime field
+    a, b = curve.curve[0].value[0], curve.curve[1].value[0]
+    p = curve.field.p
+    if p < NAIVE_BOUND:
+        return naive_trace(a, b, p)
+    t, M = schoof(a, b, p)
+    return bsgs_trace(curve, t, M)
+
+
+def extension_order(p, t, e):
+    # #E(GF(p^e)) = p^e + 1 - s_e, where s_k = alpha^k + beta^k for the
+    # roots of x^2 - tx + p satisfies s_k = t s_(k-1) - p s_(k-2)
+    s_0, s_1 = 2, t
+    for _ in range(e - 1):
+        s_0, s_1 = s_1, t * s_1 - p * s_0
+    return p**e + 1 - s_1
@@ -0,0 +1,235 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# polynomials over GF(p) are tuples of ints, lowest degree first, with no
+# trailing zeroes (zero is (0,))
+
+# below this many coefficients schoolbook multiplication beats Karatsuba
+KARATSUBA_THRESHOLD = 16
+# and below this many it beats Kronecker substitution
+KRONECKER_THRESHOLD = 8
+# use numpy when products of coefficients, summed, cannot overflow an int64
+NUMPY_BOUND = 2**63
+
+
+def trim(a):
+    n = len(a)
+    while n > 1 and not a[n-1]:
+        n -= 1
+    return tuple(a[:n])
+
+
+def poly_add(a, b, p):
+    if len(a) < len(b):
+        a, b = b, a
+    out = list(a)
+    for i, c in enumerate(b):
+        out[i] = (out[i] + c) % p
+    return trim(out)
+
+
+def poly_sub(a, b, p):
+    return poly_add(a, [-c % p for c in b], p)
+
+
+def schoolbook(a, b):
+    out = [0] * (len(a) + len(b) - 1)
+    for i, c in enumerate(a):
+        if c:
+            for j, d in enumerate(b):
+                out[i+j] += c*d
+    return out
+
+
+def karatsuba(a, b):
+    # unreduced product of two coefficient lists
+    if len(a) < KARATSUBA_THRESHOLD or len(b) < KARATSUBA_THRESHOLD:
+        return schoolbook(a, b)
+    m = max(len(a), len(b)) // 2
+    a_0, a_1 = a[:m], a[m:] or [0]
+    b_0, b_1 = b[:m], b[m:] or [0]
+    z_0 = karatsuba(a_0, b_0)
+    z_2 = karatsuba(a_1, b_1)
+    s_a = [x + y for x, y in zip_longest(a_0, a_1)]
+    s_b = [x + y for x, y in zip_longest(b_0, b_1)]
+    z_1 = karatsuba(s_a, s_b)
+    out = [0] * max(len(z_0), len(z_1) + m, len(z_2) + 2*m)
+    for i, c in enumerate(z_0):
+        out[i] += c
+        z_1[i] -= c
+    for i, c in enumerate(z_2):
+        out[i + 2*m] += c
+        z_1[i] -= c
+    for i, c in enumerate(z_1):
+        if c:
+            out[i + m] += c
+    return out[:len(a) + len(b) - 1]
+
+
+def zip_longest(a, b):
+    if len(a) < len(b):
+        a = list(a) + [0] * (len(b) - len(a))
+    elif len(b) < len(a):
+        b = list(b) + [0] * (len(a) - len(b))
+    return zip(a, b)
+
+
+def pack(a, w):
+    # the polynomial evaluated at 2^(8w), for non-negative coefficients
+    # below 2^(8w)
+    return int.from_bytes(b''.join(c.to_bytes(w, 'little') for c in a), 'little')
+
+
+def unpack(x, n, w):
+    z = x.to_bytes(n * w, 'little')
+    return [int.from_bytes(z[i:i+w], 'little') for i in range(0, n * w, w)]
+
+
+def kronecker(a, b, p):
+    # evaluate both polynomials at 2^(8w), where w bytes leave room for every
+    # coefficient of the product, and let a single big int product do the work
+    w = (2 * (p-1).bit_length() + min(len(a), len(b)).bit_length() + 7) // 8
+    x = pack(a, w)
+    # squaring one int is faster than multiplying two equal ones
+    y = x if b is a else pack(b, w)
+    return unpack(x * y, len(a) + len(b) - 1, w)
+
+
+def poly_mul(a, b, p):
+    # schoolbook for short operands; otherwise numpy when it cannot overflow,
+    # then Kronecker substitution while coefficients are at most word sized,
+    # beyond which the big int products it needs are slower than Karatsuba
+    n = min(len(a), len(b))
+    if n < KRONECKER_THRESHOLD:
+        out = schoolbook(a, b)
+    elif numpy is not None and (p-1)**2 * n < NUMPY_BOUND:
+        out = numpy.convolve(numpy.array(a, dtype=numpy.int64),
+                             numpy.array(b, dtype=numpy.int64)).tolist()
+    elif p.bit_length() <= 64:
+        out = kronecker(a, b, p)
+    else:
+        out = karatsuba(a, b)
+    return trim([c % p for c in out])
+
+
+def reduction_table(modulus, p, degree):
+    # rows[k] = x^(e+k) mod modulus for k up to degree - e, where e is the
+    # degree of the modulus, so reducing a product is a table lookup per
+    # coefficient above x^(e-1) instead of a long division
+    e = len(modulus) - 1
+    lead_inv = pow(modulus[-1], -1, p)
+    # x^e = -(modulus[:e] / lead)
+    row = [(-c * lead_inv) % p for c in modulus[:e]]
+    rows = []
+    for _ in range(max(degree - e + 1, 0)):
+        rows.append(row)
+        # multiply by x and reduce the x^e term
+        top = row[-1]
+        row = [0] + row[:-1]
+        if top:
+            row = [(c + top * r) % p for c, r in zip(row, rows[0])]
+    return rows
+
+
+def pack_rows(rows, p):
+    # the rows of a reduction table as big ints, w bytes per coefficient, so
+    # that poly_reduce can sum multiples of whole rows at once
+    if not rows:
+        return 0, []
+    w = (2 * (p-1).bit_length() + (len(rows) + 1).bit_length() + 7) // 8
+    return w, [pack(row, w) for row in rows]
+
+
+def poly_reduce(a, rows, p, packed=None):
+    # a mod the modulus whose reduction table is rows
+    e = len(rows[0]) if rows else len(a)
+    if len(a) <= e:
+        return trim(a)
+    if packed is not None and e >= KRONECKER_THRESHOLD and p.bit_length() <= 64:
+        w, packed_rows = packed
+        total = pack(a[:e], w)
+        for c, row in zip(a[e:], packed_rows):
+            total += c * row
+        return trim([c % p for c in unpack(total, e, w)])
+    out = list(a[:e])
+    for k, c in enumerate(a[e:]):
+        if c:
+            for i, r in enumerate(rows[k]):
+                out[i] += c * r
+    return trim([c % p for c in out])
+
+
+def poly_divmod(a, b, p):
+    if len(b) == 1 and not b[0]:
+        raise ZeroDivisionError('Polynomial division by zero')
+    remainder = list(a)
+    lead_inv = pow(b[-1], -1, p)
+    quotient = [0] * max(len(a) - len(b) + 1, 1)
+    for i in range(len(a) - len(b), -1, -1):
+        c = remainder[i + len(b) - 1] * lead_inv % p
+        if c:
+            quotient[i] = c
+            for j, d in enumerate(b):
+                remainder[i+j] = (remainder[i+j] - c*d) % p
+    return trim(quotient), trim(remainder[:len(b) - 1] or [0])
+
+
+def poly_powmod(a, n, modulus, p):
+    out = (1,)
+    while n:
+        if n & 1:
+            out = poly_divmod(poly_mul(out, a, p), modulus, p)[1]
+        a = poly_divmod(poly_mul(a, a, p), modulus, p)[1]
+        n >>= 1
+    return out
+
+
+def poly_gcd(a, b, p):
+    while b != (0,):
+        a, b = b, poly_divmod(a, b, p)[1]
+    return a
+
+
+def poly_inverse(a, modulus, p):
+    # iterative extended Euclid: s*a = r (mod modulus) throughout
+    r_0, r_1 = modulus, a
+    s_0, s_1 = (0,), (1,)
+    while r_1 != (0,):
+        quotient, remainder = poly_divmod(r_0, r_1, p)
+        r_0, r_1 = r_1, remainder
+        s_0, s_1 = s_1, poly_sub(s_0, poly_mul(quotient, s_1, p), p)
+    if len(r_0) > 1:
+        raise ZeroDivisionError('Polynomial not invertible modulo the modulus')
+    inv = pow(r_0[0], -1, p)
+    return trim([c * inv % p for c in s_0])
+
+
+def frobenius_table(modulus, p, k):
+    # rows[i] = x^(i p^k) mod modulus, so that a^(p^k) = sum a_i rows[i]
+    e = len(modulus) - 1
+    x_p = poly_powmod((0, 1), p**k, modulus, p)
+    rows = [(1,)]
+    for _ in range(e - 1):
+        rows.append(poly_divmod(poly_mul(rows[-1], x_p, p), modulus, p)[1])
+    return [list(row) + [0] * (e - len(row)) for row in rows]
+
+
+def poly_transform(a, rows, p, packed=None):
+    # sum of a_i rows[i], e.g. a linear map such as the Frobenius
+    e = len(rows[0])
+    if packed is not None and e >= KRONECKER_THRESHOLD and p.bit_length() <= 64:
+        w, packed_rows = packed
+        total = 0
+        for c, row in zip(a, packed_rows):
+            if c:
+                total += c * row
+        return trim([c % p for c in unpack(total, e, w)])
+    out = [0] * e
+    for c, row in zip(a, rows):
+        if c:
+            for i, r in enumerate(row):
+                out[i] += c * r
+    return trim([c % p for c in out])
@@ -1,3 +1,4 @@
+import heapq
 import math
 from collections import Counter
 from random import randint
@@ -64,12 +65,26 @@ def mod_mult_inv(x, m):
 
 
 def prime_factorise(n, start=2, counted=False):
+    # trial division by a table of small primes (none below start divide n),
+    # then Pollard rho and ECM on what is left
     if counted:
         return Counter(prime_factorise(n, start=start))
-    for i in range(start, int(math.sqrt(n))+1):
-        if n % i == 0:
-            return [i] + prime_factorise(n//i, start=i)
-    return [n]
+    if n < 2:
+        return [n]
+    factors = []
+    for q in small_primes:
+        if q*q > n:
+            break
+        elif q < start:
+            continue
+        while n % q == 0:
+            factors.append(q)
+            n //= q
+    else:
+        return sorted(factors + factorise_large(n))
+    if n > 1:
+        factors.append(n)
+    return factors
 
 
 def chinese_remainder_theorem(congruences):
@@ -88,11 +103,74 @@ def chinese_remainder_theorem(congruences):
 
 
 def is_b_smooth(x, b):
-    factors = prime_factorise(x)
-    if max(factors) <= b:
+    # trial division by the primes up to b, rather than a full factorisation;
+    # 0 counts as smooth, as it did when its factorisation was [0]
+    if x == 0:
         return True
-    else:
-        return False
+    for q in eratosthenes(b):
+        if x == 1:
+            break
+        while x % q == 0:
+            x //= q
+    return x == 1
+
+
+def product_tree(values):
+    # levels from values up to [product of values], each the pairwise
+    # products of the one below
+    tree = [list(values)]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        tree.append([level[i] * level[i+1] for i in range(0, len(level) - 1, 2)])
+        if len(level) % 2:
+            tree[-1].append(level[-1])
+    return tree
+
+
+def remainder_tree(n, tree):
+    # n mod each leaf of a product tree, reducing down from the root
+    out = [n % tree[-1][0]]
+    for level in reversed(tree[:-1]):
+        out = [out[i // 2] % v for i, v in enumerate(level)]
+    return out
+
+
+def batch_smooth(values, primes, prime_tree=None):
+    # Counter of prime -> exponent for each of the positive values that
+    # factors over primes, None for the others, by Bernstein's batch method:
+    # with P the product of primes, x is smooth iff P^(2^e) = 0 mod x for
+    # 2^e at least the bit length of x, and a remainder tree gives P mod x
+    # for every x at once. The smooth values are then split along the
+    # product tree of primes
+    if not values:
+        return []
+    if prime_tree is None:
+        prime_tree = product_tree(primes)
+    out = []
+    for x, z in zip(values, remainder_tree(prime_tree[-1][0], product_tree(values))):
+        for _ in range((x.bit_length() - 1).bit_length()):
+            z = z*z % x
+        out.append(tree_factorise(x, prime_tree) if z == 0 else None)
+    return out
+
+
+def tree_factorise(x, tree):
+    # x factors over the leaves of the product tree: follow the subtrees
+    # whose product shares a factor with x down to its primes
+    out = Counter()
+    stack = [(len(tree) - 1, 0)]
+    while stack and x > 1:
+        level, i = stack.pop()
+        if math.gcd(x, tree[level][i]) == 1:
+            continue
+        elif level == 0:
+            q = tree[0][i]
+            while x % q == 0:
+                x //= q
+                out[q] += 1
+        else:
+            stack.extend((level - 1, j) for j in (2*i, 2*i + 1) if j < len(tree[level - 1]))
+    return out
 
 
 def eratosthenes(limit):
@@ -104,6 +182,297 @@ def eratosthenes(limit):
     return [i for i, prime in enumerate(is_prime) if prime]
 
 
+# primes for trial division; a number with no factor in the table and below
+# TRIAL_BOUND^2 is prime
+TRIAL_BOUND = 2**12
+small_primes = eratosthenes(TRIAL_BOUND)
+# primes sieved out of candidates when generating primes
+sieve_primes = eratosthenes(2**16)
+# Pollard rho steps before moving on to ECM
+RHO_ITERATIONS = 2**16
+# (B1, curves) for ECM, as for factors of about 15, 20 and 25 digits; stage
+# two runs to 100 B1
+ECM_SCHEDULE = [(2000, 25), (11000, 90), (50000, 300)]
+
+
+# Miller-Rabin with these bases has no strong pseudoprimes below 2^64
+MR_BASES_64 = (2, 325, 9375, 28178, 450775, 9780504, 1795265022)
+
+
+def miller_rabin(n, bases):
+    # False if some base witnesses that odd n > 2 is composite
+    d, s = n-1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in bases:
+        a %= n
+        if a == 0:
+            continue
+        x = pow(a, d, n)
+        if x == 1 or x == n-1:
+            continue
+        for _ in range(s-1):
+            x = x*x % n
+            if x == n-1:
+                break
+        else:
+            return False
+    return True
+
+
+def jacobi_symbol(a, n):
+    # (a/n) for odd n > 0, by quadratic reciprocity
+    a %= n
+    out = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                out = -out
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            out = -out
+        a %= n
+    return out if n == 1 else 0
+
+
+def strong_lucas(n):
+    # strong Lucas probable prime test on odd n, not a square, with
+    # Selfridge's parameters: the first D in 5, -7, 9, -11, ... with
+    # (D/n) = -1, P = 1 and Q = (1 - D)/4
+    D = 5
+    while True:
+        j = jacobi_symbol(D, n)
+        if j == -1:
+            break
+        elif j == 0 and abs(D) != n:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    Q = (1 - D) // 4
+    d, s = n+1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    # U_k, V_k and Q^k, from k = 1 along the bits of d
+    U, V, Q_k = 1, 1, Q % n
+    for bit in bin(d)[3:]:
+        U, V = U*V % n, (V*V - 2*Q_k) % n
+        Q_k = Q_k*Q_k % n
+        if bit == '1':
+            U, V = (U + V) % n, (D*U + V) % n
+            U = (U + n if U % 2 else U) // 2
+            V = (V + n if V % 2 else V) // 2
+            Q_k = Q_k*Q % n
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s-1):
+        V = (V*V - 2*Q_k) % n
+        Q_k = Q_k*Q_k % n
+        if V == 0:
+            return True
+    return False
+
+
+def is_prime(n):
+    # Miller-Rabin, deterministic below 2^64, and Baillie-PSW above, which
+    # has no known pseudoprimes
+    if n < 2:
+        return False
+    for q in small_primes[:13]:
+        if n % q == 0:
+            return n == q
+    if n < 2**64:
+        return miller_rabin(n, MR_BASES_64)
+    if not miller_rabin(n, (2,)):
+        return False
+    r = integer_root(n, 2)
+    return r*r != n and strong_lucas(n)
+
+
+def sieve_progressions(progressions, length):
+    # the i < length for which no prime in sieve_primes divides a + bi for
+    # any (a, b) in progressions, other than a prime a + bi itself
+    keep = bytearray([1]) * length
+    for q in sieve_primes:
+        for a, b in progressions:
+            if b % q == 0 or q >= a:
+                continue
+            i = -a * pow(b, -1, q) % q
+            keep[i::q] = bytes(len(range(i, length, q)))
+    return [i for i in range(length) if keep[i]]
+
+
+def random_prime(bits):
+    # uniform start, then the first prime of the odd numbers after it that
+    # survive a sieve by sieve_primes
+    if bits < 2:
+        raise ValueError('No primes with fewer than 2 bits')
+    while True:
+        a = randint(2**(bits-1), 2**bits - 1) | 1
+        for i in sieve_progressions([(a, 2)], 4*bits):
+            p = a + 2*i
+            if p.bit_length() == bits and is_prime(p):
+                return p
+
+
+def safe_prime(bits):
+    # p = 2q + 1 with q prime; both are sieved together, and a base 2 Fermat
+    # test on q weeds out most candidates before the full tests
+    if bits < 3:
+        raise ValueError('No safe primes with fewer than 3 bits')
+    while True:
+        q_0 = randint(2**(bits-2), 2**(bits-1) - 1) | 1
+        for i in sieve_progressions([(q_0, 2), (2*q_0 + 1, 4)], 64*bits):
+            q = q_0 + 2*i
+            p = 2*q + 1
+            if p.bit_length() == bits and (q < 4 or pow(2, q-1, q) == 1) \
+                    and is_prime(q) and is_prime(p):
+                return p
+
+
+def dsa_parameters(L=2048, N=256):
+    # (p, q, g) with q an N-bit prime, p an L-bit prime with q | p - 1 and g
+    # of order q in GF(p)*
+    if N >= L:
+        raise ValueError('q must be smaller than p')
+    q = random_prime(N)
+    while True:
+        k_0 = randint(2**(L-1) // q, (2**L - 1) // q) & ~1
+        for i in sieve_progressions([(q*k_0 + 1, 2*q)], 4*(L-N) + 4):
+            p = q*(k_0 + 2*i) + 1
+            if p.bit_length() == L and is_prime(p):
+                for h in range(2, p-1):
+                    g = pow(h, (p-1) // q, p)
+                    if g != 1:
+                        return p, q, g
+
+
+def integer_root(n, k):
+    # floor of the k-th root of n, by Newton's method
+    x = 1 << -(-n.bit_length() // k)
+    while True:
+        y = ((k-1)*x + n // x**(k-1)) // k
+        if y >= x:
+            return x
+        x = y
+
+
+def factorise_large(n):
+    # prime factors of n > 1, which has no factor in small_primes
+    if n == 1:
+        return []
+    elif n < TRIAL_BOUND**2 or is_prime(n):
+        return [n]
+    for k in range(2, n.bit_length() // TRIAL_BOUND.bit_length() + 1):
+        r = integer_root(n, k)
+        if r**k == n:
+            return factorise_large(r) * k
+    d = pollard_brent(n, RHO_ITERATIONS) or ecm(n) or pollard_brent(n)
+    return factorise_large(d) + factorise_large(n // d)
+
+
+def pollard_brent(n, iterations=None, m=128):
+    # Pollard rho on x -> x^2 + c with Brent's cycle detection, taking one
+    # gcd for each m products of differences; None after that many steps
+    steps = 0
+    while iterations is None or steps < iterations:
+        y, c = randint(1, n-1), randint(1, n-1)
+        g = r = q = 1
+        while g == 1 and (iterations is None or steps < iterations):
+            x = y
+            for _ in range(r):
+                y = (y*y + c) % n
+            k = 0
+            while k < r and g == 1:
+                y_s = y
+                for _ in range(min(m, r-k)):
+                    y = (y*y + c) % n
+                    q = q * abs(x-y) % n
+                g = math.gcd(q, n)
+                k += m
+            steps += r
+            r *= 2
+        if g == n:
+            # the batch overshot: retrace it one difference at a time
+            g = 1
+            while g == 1:
+                y_s = (y_s*y_s + c) % n
+                g = math.gcd(abs(x-y_s), n)
+        if 1 < g < n:
+            return g
+
+
+def ecm(n, schedule=None):
+    # Lenstra's elliptic curve method: a factor p of n shows up when the
+    # order of a random curve mod p is B1-smooth but for one prime below B2
+    from groups.finitefield import FiniteField
+    field = FiniteField(n, 1)
+    for B1, curves in schedule or ECM_SCHEDULE:
+        k = 1
+        for q in eratosthenes(B1):
+            k *= q**int(math.log(B1, q))
+        primes = [q for q in eratosthenes(100*B1) if q > B1]
+        for _ in range(curves):
+            d = ecm_curve(field, k, primes)
+            if d:
+                return d
+
+
+def ecm_curve(field, k, primes):
+    from groups.ellipticcurve import EllipticCurve
+    from groups.ecpoint import ECPoint
+    n = field.p
+    x, y, a = randint(0, n-1), randint(0, n-1), randint(0, n-1)
+    b = (y*y - x**3 - a*x) % n
+    g = math.gcd(4*a**3 + 27*b*b, n)
+    if g > 1:
+        return g if g < n else None
+
+    # stage one: Jacobian coordinates need no inverses, so a factor shows
+    # up in the gcd of n with Z of kQ
+    Q = EllipticCurve((a, b), field).point(x, y)**k
+    if Q.is_identity():
+        return None
+    g = math.gcd(Q.jacobian[2].n, n)
+    if g > 1:
+        return g if g < n else None
+
+    # stage two: each prime q = vD +- u in (B1, B2] is caught by
+    # x(vDQ) - x(uQ), for baby steps u < D/2 prime to D and giant steps vD
+    D = 2310
+    Q_2 = Q + Q
+    babies = {1: Q}
+    R = Q
+    for u in range(3, D//2, 2):
+        R = R + Q_2
+        if math.gcd(u, D) == 1:
+            babies[u] = R
+    G = Q**D
+    v_0 = primes[0] // D
+    giants = [G**v_0]
+    for _ in range(primes[-1] // D - v_0 + 1):
+        giants.append(giants[-1] + G)
+    points = list(babies.values()) + giants
+    if any(P.is_identity() for P in points):
+        return None
+    Z = 1
+    for P in points:
+        Z = Z * P.jacobian[2].n % n
+    g = math.gcd(Z, n)
+    if g > 1:
+        return g if g < n else None
+    ECPoint.batch_normalize(points)
+
+    acc = 1
+    for q in primes:
+        v = (q + D//2) // D
+        acc = acc * (giants[v - v_0].value[0].n - babies[abs(q - v*D)].value[0].n) % n
+    g = math.gcd(acc, n)
+    return g if 1 < g < n else None
+
+
 def primitive_root(p):
     factors = set(prime_factorise(p-1))
     for i in range(1, p):
@@ -160,27 +529,75 @@ def reduced_row_echelon(M, p):
     return M
 
 
+def sparse_solve(rows, n, m):
+    # x with sum of c x_k over k, c in row = value (mod m) for every
+    # (row, value) in rows, each row a dict k -> c for unknowns k < n, and
+    # x_k None where the rows do not pin x_k down. Gaussian elimination on
+    # the dicts, so rows stay about as sparse as the elimination allows:
+    # Markowitz pivoting takes the column with the fewest entries (by a heap
+    # of possibly stale counts) and, of its rows with a unit there, the
+    # sparsest
+    rows = [({k: c % m for k, c in row.items() if c % m}, value % m) for row, value in rows]
+    columns = [set() for _ in range(n)]
+    for i, (row, _) in enumerate(rows):
+        for k in row:
+            columns[k].add(i)
+    heap = [(len(column), k) for k, column in enumerate(columns)]
+    heapq.heapify(heap)
+    done = [False] * n
+    pivots = []
+    while heap:
+        count, k = heapq.heappop(heap)
+        if done[k]:
+            continue
+        elif count < len(columns[k]):
+            heapq.heappush(heap, (len(columns[k]), k))
+            continue
+        units = [i for i in columns[k] if math.gcd(rows[i][0][k], m) == 1]
+        done[k] = True
+        if not units:
+            continue
+        i = min(units, key=lambda i: len(rows[i][0]))
+        row, value = rows[i]
+        inv = pow(row[k], -1, m)
+        row = {j: c*inv % m for j, c in row.items()}
+        value = value*inv % m
+        for j in row:
+            columns[j].discard(i)
+
+        # clear column k from every other row
+        for i in columns[k]:
+            other, other_value = rows[i]
+            f = other[k]
+            for j, c in row.items():
+                c = (other.get(j, 0) - f*c) % m
+                if c:
+                    if j not in other:
+                        columns[j].add(i)
+                    other[j] = c
+                elif j in other:
+                    del other[j]
+                    if j != k:
+                        columns[j].discard(i)
+            rows[i] = (other, (other_value - f*value) % m)
+        columns[k] = set()
+        pivots.append((k, row, value))
+
+    # each pivot row only has columns pivoted after it, or left without a
+    # pivot
+    x = [None] * n
+    for k, row, value in reversed(pivots):
+        if all(x[j] is not None for j in row if j != k):
+            x[k] = (value - sum(c*x[j] for j, c in row.items() if j != k)) % m
+    return x
+
+
 def legendre_symbol(a, p):
-    try:
-        a = a % p
-    except ZeroDivisionError:
+    # Euler's criterion, for odd primes p
+    a = a % p
+    if a == 0:
         return 0
-    factorisation = prime_factorise(a, counted=True)
-    out = 1
-    for factor in factorisation.keys():
-        if factor == p-1:
-            if p % 4 == 3:
-                out *= (-1)**factorisation[factor]
-        elif factor == 2:
-            if p % 8 == 3 or p % 8 == 5:
-                out *= (-1)**factorisation[factor]
-        else:
-            if factor % 4 == 3 and p % 4 == 3:
-                out *= (-legendre_symbol(p, factor))**factorisation[factor]
-            else:
-                out *= (legendre_symbol(p, factor))**factorisation[factor]
-
-    return out
+    return 1 if pow(a, (p-1)//2, p) == 1 else -1
 
 
 def cmod(z, p, i):
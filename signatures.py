@@ -1,5 +1,19 @@
 import number_theory as nt
 from random import randint
+from groups.exponentiation import multi_exp
+from groups.groupelement import GroupElement
+from groups.intmodp import IntModP
+
+
+def elgamal_keygen(bits=1024):
+    # p a safe prime 2q + 1, so g generates GF(p)* when g^2 and g^q are not 1
+    p = nt.safe_prime(bits)
+    q = (p-1) // 2
+    g = 2
+    while pow(g, 2, p) == 1 or pow(g, q, p) == 1:
+        g += 1
+    x = randint(2, p-2)
+    return (p, g, pow(g, x, p)), x
 
 
 def elgamal_sign(m, key, x):
@@ -19,12 +33,21 @@ def elgamal_sign(m, key, x):
 def elgamal_verify(m, key, sig):
     s_1, s_2 = sig[0], sig[1]
     p, g, y = key[0], key[1], key[2]
+    if not (0 < s_1 < p and 0 <= s_2 < p-1):
+        return False
 
-    if pow(g, m, p) == (pow(y, s_1, p) * pow(s_1, s_2, p)) % p:
+    if pow(g, m, p) == multi_exp([(IntModP(y, p), s_1), (IntModP(s_1, p), s_2)]).value:
         return True
     return False
 
 
+def dsa_keygen(L=2048, N=256):
+    p, q, g = nt.dsa_parameters(L, N)
+    g = IntModP(g, p)
+    x = randint(1, q-1)
+    return (q, g, g**x), x
+
+
 def dsa_sign(m, key, x):
     q, g = key[0], key[1]
     k = randint(2, q-1)
@@ -36,8 +59,15 @@ def dsa_sign(m, key, x):
 def dsa_verify(m, key, sig):
     s_1, s_2 = sig[0], sig[1]
     q, g, y = key[0], key[1], key[2]
+    if not (0 < s_1 < q and 0 < s_2 < q):
+        return False
     v_1 = m*nt.mod_mult_inv(s_2, q) % q
     v_2 = s_1 * nt.mod_mult_inv(s_2, q) % q
-    if (g**v_1*y**v_2) % q == s_1:
+    # keys with plain int g and y still go through int powers
+    if isinstance(g, GroupElement):
+        v = multi_exp([(g, v_1), (y, v_2)])
+    else:
+        v = g**v_1*y**v_2
+    if v % q == s_1:
         return True
     return False
\ No newline at end of file